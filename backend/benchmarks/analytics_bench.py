@@ -0,0 +1,146 @@
+"""Сравнение векторного CheckSeries с построчными расчетами на Python.
+
+Построчные расчеты идут по документам в том виде, в каком их отдает find().
+Для CheckSeries учитывается и сборка массивов: из тех же документов
+(from_documents) и из суточных колонок, которые возвращает агрегация
+load_check_series (from_column_chunks). Декодирование BSON драйвером
+не входит ни в один из замеров.
+
+Запуск из каталога backend:
+    python -m benchmarks.analytics_bench --samples 1000000
+"""
+import argparse
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from services.analytics import CheckSeries
+
+
+def _python_uptime(checks):
+    return sum(1 for check in checks if check["status"] == "online") / len(checks) * 100
+
+
+def _python_average(checks):
+    response_times = [check["response_time"] for check in checks if check["response_time"] is not None]
+    return sum(response_times) / len(response_times)
+
+
+def _python_moving_average(checks, window):
+    values = deque()
+    total = 0.0
+    result = []
+    for check in checks:
+        values.append(check["response_time"] or 0.0)
+        total += values[-1]
+        if len(values) > window:
+            total -= values.popleft()
+        if len(values) == window:
+            result.append(total / window)
+    return result
+
+
+def _python_downtime(checks):
+    intervals = []
+    started = None
+    for check in checks:
+        if check["status"] != "online" and started is None:
+            started = check["checked_at"]
+        elif check["status"] == "online" and started is not None:
+            intervals.append((started, check["checked_at"]))
+            started = None
+    return intervals
+
+
+def _python_trend(checks, start, granularity, buckets):
+    # Как в прежнем get_site_stats: отдельный проход по списку на каждый интервал
+    trend = []
+    for i in range(buckets):
+        bucket_start = start + granularity * i
+        bucket_end = bucket_start + granularity
+        bucket = [check for check in checks if bucket_start <= check["checked_at"] < bucket_end]
+        online = sum(1 for check in bucket if check["status"] == "online")
+        trend.append(online / len(bucket) * 100 if bucket else 0)
+    return trend
+
+
+def _measure(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=288)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    start = datetime(2024, 1, 1)
+    offsets = np.sort(rng.integers(0, 365 * 86400, args.samples))
+    timestamps = np.datetime64(start, "s") + offsets.astype("timedelta64[s]")
+    online = rng.random(args.samples) > 0.02
+    latency = np.where(rng.random(args.samples) > 0.01, rng.lognormal(5, 0.5, args.samples), np.nan)
+
+    checks = [
+        {
+            "checked_at": ts,
+            "status": "online" if ok else "offline",
+            "status_code": 200,
+            "response_time": None if np.isnan(rt) else float(rt),
+        }
+        for ts, ok, rt in zip(timestamps.astype(datetime).tolist(), online.tolist(), latency.tolist())
+    ]
+    # Суточные колонки в форме ответа агрегации load_check_series
+    epoch_ms = timestamps.astype("datetime64[ms]").astype(np.int64)
+    day_ids = epoch_ms // (86400 * 1000)
+    bounds = np.flatnonzero(np.diff(day_ids)) + 1
+    chunks = [
+        {
+            "epoch_ms": ms.tolist(),
+            "online": ok.tolist(),
+            "status_code": [200] * len(ms),
+            "response_time": [None if np.isnan(rt) else rt for rt in lat.tolist()],
+        }
+        for ms, ok, lat in zip(np.split(epoch_ms, bounds), np.split(online, bounds), np.split(latency, bounds))
+    ]
+    series = CheckSeries.from_column_chunks(chunks)
+
+    day = timedelta(days=1)
+    cases = [
+        ("uptime", lambda: _python_uptime(checks), series.uptime_percentage),
+        ("average latency", lambda: _python_average(checks), series.average_response_time),
+        ("moving average", lambda: _python_moving_average(checks, args.window),
+         lambda: series.moving_average_latency(args.window)),
+        ("downtime intervals", lambda: _python_downtime(checks), series.downtime_intervals),
+        ("7-day trend", lambda: _python_trend(checks, start + 358 * day, day, 7),
+         lambda: series.trend(day, start=start + 358 * day)),
+    ]
+
+    build_documents = _measure(lambda: CheckSeries.from_documents(checks), 1)
+    build_chunks = _measure(lambda: CheckSeries.from_column_chunks(chunks), 3)
+    print(f"{args.samples} samples")
+    print(f"build from documents: {build_documents:.4f}s, from column chunks: {build_chunks:.4f}s")
+    print(f"{'operation':<20}{'python, s':>12}{'numpy, s':>12}{'+build, s':>12}{'speedup':>10}")
+    python_total = numpy_total = 0.0
+    for name, python_func, numpy_func in cases:
+        python_time = _measure(python_func, 1)
+        numpy_time = _measure(numpy_func, 3)
+        python_total += python_time
+        numpy_total += numpy_time
+        # Ускорение с учетом сборки, если ради одного расчета загружается весь ряд
+        total_time = numpy_time + build_chunks
+        print(f"{name:<20}{python_time:>12.4f}{numpy_time:>12.4f}{total_time:>12.4f}{python_time / total_time:>9.1f}x")
+    # Все расчеты по одной загрузке (как /stats/{id}/analytics): сборка делится между ними
+    total_time = numpy_total + build_chunks
+    print(f"{'all, one build':<20}{python_total:>12.4f}{numpy_total:>12.4f}{total_time:>12.4f}{python_total / total_time:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
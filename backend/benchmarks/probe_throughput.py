@@ -0,0 +1,408 @@
+"""Офлайн-бенчмарк пропускной способности проверок на локальной ферме сайтов.
+
+Ферма (отдельный процесс) поднимает N фейковых сайтов с заданной задержкой,
+долей ошибок, медленным TLS и зависшими соединениями. Сайты разнесены по
+адресам 127.0.x.y, чтобы лимиты на хост работали как с реальными сайтами.
+Сеть не нужна (Linux: весь 127.0.0.0/8 - loopback).
+
+Запуск из каталога backend:
+    python -m benchmarks.probe_throughput --sites 1000 --rounds 3
+    python -m benchmarks.probe_throughput --scheduler-seconds 20 --min-checks-per-sec 150
+
+Пороговые флаги (--min-checks-per-sec, --max-p99-overhead-ms, --max-fds,
+--max-rss-mb) завершают процесс с кодом 1 при регрессии - для CI.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+from models import Site
+from services.monitoring import MonitoringService
+from services.scheduler import CheckScheduler
+
+# Минимальный допустимый интервал Site - чтобы планировщик успевал сделать несколько кругов
+SITE_CHECK_INTERVAL = 10
+
+
+# Ферма сайтов
+
+def build_plan(args) -> List[Dict[str, Any]]:
+    """Вид и задержка каждого сайта; одинаково строится в ферме и в клиенте"""
+    rng = random.Random(args.seed)
+    plan = []
+    for i in range(args.sites):
+        roll = rng.random()
+        if roll < args.hang_fraction:
+            kind = "hang"
+        elif roll < args.hang_fraction + args.tls_fraction:
+            kind = "tls"
+        else:
+            kind = "http"
+        latency = max(0.0, args.latency_ms + rng.uniform(-args.latency_jitter_ms, args.latency_jitter_ms))
+        plan.append({"kind": kind, "latency_ms": latency, "host": f"127.0.{i // 250}.{i % 250 + 1}"})
+    return plan
+
+
+def _self_signed_cert(directory: str):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "siteguard-bench")])
+    now = dt.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - dt.timedelta(days=1))
+        .not_valid_after(now + dt.timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _run_farm(args, ready):
+    import ssl
+
+    plan = build_plan(args)
+    rng = random.Random(args.seed + 1)
+
+    async def handle(request):
+        site = plan[int(request.match_info["index"])]
+        await asyncio.sleep(site["latency_ms"] / 1000)
+        if rng.random() < args.error_rate:
+            return web.Response(status=503, text="unavailable")
+        return web.Response(body=b"x" * args.body_bytes)
+
+    app = web.Application()
+    app.router.add_get("/s/{index}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    http_site = web.TCPSite(runner, "0.0.0.0", 0, backlog=4096)
+    await http_site.start()
+    http_port = http_site._server.sockets[0].getsockname()[1]
+
+    directory = tempfile.mkdtemp(prefix="siteguard-bench-")
+    cert_path, key_path = _self_signed_cert(directory)
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(cert_path, key_path)
+    https_site = web.TCPSite(runner, "127.0.0.1", 0, ssl_context=ssl_context, backlog=4096)
+    await https_site.start()
+    https_port = https_site._server.sockets[0].getsockname()[1]
+
+    async def slow_tls(reader, writer):
+        # Задержка перед пересылкой ClientHello - медленное TLS-рукопожатие
+        await asyncio.sleep(args.tls_delay_ms / 1000)
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", https_port)
+        except OSError:
+            writer.close()
+            return
+        await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+    hung = []
+
+    async def hang(reader, writer):
+        # Соединение принимается, но ответ не приходит никогда
+        hung.append(writer)
+        await reader.read()
+
+    tls_server = await asyncio.start_server(slow_tls, "0.0.0.0", 0, backlog=4096)
+    hang_server = await asyncio.start_server(hang, "0.0.0.0", 0, backlog=4096)
+    ready.send({
+        "http": http_port,
+        "tls": tls_server.sockets[0].getsockname()[1],
+        "hang": hang_server.sockets[0].getsockname()[1],
+    })
+    await asyncio.Event().wait()
+
+
+def _farm_process(args, ready):
+    resource.setrlimit(resource.RLIMIT_NOFILE, _raised_nofile_limit())
+    asyncio.run(_run_farm(args, ready))
+
+
+def _raised_nofile_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return (hard if hard != resource.RLIM_INFINITY else max(soft, 65536), hard)
+
+
+# Замеры клиента
+
+def _open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+class _ResourceSampler:
+    """Пиковые значения открытых дескрипторов и RSS во время прогона"""
+
+    def __init__(self, period: float = 0.05):
+        self.period = period
+        self.peak_fds = 0
+        self.peak_rss_mb = 0.0
+        self._task = None
+
+    def sample(self):
+        self.peak_fds = max(self.peak_fds, _open_fds())
+        self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb())
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.period)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.sample()
+
+
+class _MemoryStore:
+    """Минимальная замена DatabaseService для планировщика: сайты в памяти, результаты считаются"""
+
+    def __init__(self, sites: List[Site]):
+        self.sites = sites
+        self.recorded = 0
+
+    async def get_all_sites(self) -> List[Site]:
+        return list(self.sites)
+
+    async def record_check_results(self, check_results, progress=None):
+        self.recorded += len(check_results)
+        return check_results
+
+
+def _percentile(values: List[float], q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def build_sites(plan, ports) -> List[Site]:
+    sites = []
+    for i, spec in enumerate(plan):
+        scheme = "https" if spec["kind"] == "tls" else "http"
+        sites.append(Site(
+            id=f"bench-{i}",
+            name=f"bench-{i}",
+            url=f"{scheme}://{spec['host']}:{ports[spec['kind']]}/s/{i}",
+            owner_id="bench",
+            check_interval=SITE_CHECK_INTERVAL,
+        ))
+    return sites
+
+
+def _new_monitoring(args) -> MonitoringService:
+    return MonitoringService(
+        max_concurrency=args.concurrency,
+        per_host_concurrency=args.per_host_concurrency,
+        request_timeout=args.timeout,
+        ssl_timeout=args.timeout,
+    )
+
+
+async def run_batch(args, plan, sites) -> Dict[str, Any]:
+    """Раунды check_multiple_sites по всем сайтам"""
+    monitoring = _new_monitoring(args)
+    await monitoring.start()
+    results = []
+    try:
+        with _ResourceSampler() as sampler:
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                results.extend(await monitoring.check_multiple_sites(sites))
+            elapsed = time.perf_counter() - started
+    finally:
+        await monitoring.close()
+
+    latency = {f"bench-{i}": spec["latency_ms"] for i, spec in enumerate(plan) if spec["kind"] == "http"}
+    # Накладные расходы: полное время проверки минус задержка, заданная на ферме
+    overhead = [
+        result.total_time - latency[result.site_id]
+        for result in results
+        if result.site_id in latency and result.total_time is not None and result.status_code is not None
+    ]
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[result.status.value] = statuses.get(result.status.value, 0) + 1
+    return {
+        "checks": len(results),
+        "seconds": elapsed,
+        "checks_per_sec": len(results) / elapsed if elapsed else 0.0,
+        "p50_overhead_ms": _percentile(overhead, 0.5),
+        "p99_overhead_ms": _percentile(overhead, 0.99),
+        "statuses": statuses,
+        "peak_fds": sampler.peak_fds,
+        "peak_rss_mb": sampler.peak_rss_mb,
+    }
+
+
+async def run_scheduler(args, sites) -> Dict[str, Any]:
+    """Постоянная нагрузка через CheckScheduler с заданным темпом"""
+    monitoring = _new_monitoring(args)
+    await monitoring.start()
+    store = _MemoryStore(sites)
+    scheduler = CheckScheduler(
+        store, monitoring, rate=args.scheduler_rate, max_in_flight=args.concurrency, flush_interval=0.2
+    )
+    try:
+        with _ResourceSampler() as sampler:
+            await scheduler.start()
+            await asyncio.sleep(args.scheduler_seconds)
+            await scheduler.stop()
+    finally:
+        await monitoring.close()
+    return {
+        "checks": store.recorded,
+        "seconds": args.scheduler_seconds,
+        "checks_per_sec": store.recorded / args.scheduler_seconds,
+        # Темп ограничен и rate, и числом сайтов на интервал проверки
+        "target_rate": min(args.scheduler_rate, len(sites) / SITE_CHECK_INTERVAL),
+        "peak_fds": sampler.peak_fds,
+        "peak_rss_mb": sampler.peak_rss_mb,
+    }
+
+
+def check_thresholds(args, report) -> List[str]:
+    failures = []
+    batch = report["batch"]
+    if args.min_checks_per_sec is not None and batch["checks_per_sec"] < args.min_checks_per_sec:
+        failures.append(f"checks/sec {batch['checks_per_sec']:.1f} < {args.min_checks_per_sec}")
+    p99 = batch["p99_overhead_ms"]
+    if args.max_p99_overhead_ms is not None and p99 is not None and p99 > args.max_p99_overhead_ms:
+        failures.append(f"p99 overhead {p99:.1f} ms > {args.max_p99_overhead_ms}")
+    for phase, stats in report.items():
+        if not isinstance(stats, dict) or "peak_fds" not in stats:
+            continue
+        if args.max_fds is not None and stats["peak_fds"] > args.max_fds:
+            failures.append(f"{phase}: peak fds {stats['peak_fds']} > {args.max_fds}")
+        if args.max_rss_mb is not None and stats["peak_rss_mb"] > args.max_rss_mb:
+            failures.append(f"{phase}: peak rss {stats['peak_rss_mb']:.1f} MB > {args.max_rss_mb}")
+    return failures
+
+
+def _print_report(report):
+    batch = report["batch"]
+    print(f"sites: {report['sites']} ({report['kinds']})")
+    print(f"batch: {batch['checks']} checks in {batch['seconds']:.2f}s -> {batch['checks_per_sec']:.1f} checks/sec")
+    if batch["p99_overhead_ms"] is not None:
+        print(f"  probe overhead p50 {batch['p50_overhead_ms']:.2f} ms, p99 {batch['p99_overhead_ms']:.2f} ms")
+    print(f"  statuses {batch['statuses']}")
+    print(f"  peak fds {batch['peak_fds']}, peak rss {batch['peak_rss_mb']:.1f} MB")
+    scheduled = report.get("scheduler")
+    if scheduled:
+        print(
+            f"scheduler: {scheduled['checks']} checks in {scheduled['seconds']:.0f}s -> "
+            f"{scheduled['checks_per_sec']:.1f} checks/sec (target {scheduled['target_rate']:.1f})"
+        )
+        print(f"  peak fds {scheduled['peak_fds']}, peak rss {scheduled['peak_rss_mb']:.1f} MB")
+
+
+async def run(args) -> Dict[str, Any]:
+    plan = build_plan(args)
+    parent, child = multiprocessing.Pipe()
+    farm = multiprocessing.Process(target=_farm_process, args=(args, child), daemon=True)
+    farm.start()
+    try:
+        if not parent.poll(30):
+            raise RuntimeError("Site farm did not start")
+        ports = parent.recv()
+        sites = build_sites(plan, ports)
+        kinds: Dict[str, int] = {}
+        for spec in plan:
+            kinds[spec["kind"]] = kinds.get(spec["kind"], 0) + 1
+        report: Dict[str, Any] = {"sites": len(sites), "kinds": kinds}
+        report["batch"] = await run_batch(args, plan, sites)
+        if args.scheduler_seconds > 0:
+            report["scheduler"] = await run_scheduler(args, sites)
+        return report
+    finally:
+        farm.terminate()
+        farm.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="доля ответов 503")
+    parser.add_argument("--tls-fraction", type=float, default=0.1, help="доля сайтов с медленным TLS")
+    parser.add_argument("--tls-delay-ms", type=float, default=200.0)
+    parser.add_argument("--hang-fraction", type=float, default=0.01, help="доля зависающих сайтов")
+    parser.add_argument("--body-bytes", type=int, default=2048)
+    parser.add_argument("--timeout", type=float, default=2.0, help="таймаут проверки, с")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--per-host-concurrency", type=int, default=4)
+    parser.add_argument("--scheduler-seconds", type=float, default=0.0)
+    parser.add_argument("--scheduler-rate", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="вывести отчет в JSON")
+    parser.add_argument("--min-checks-per-sec", type=float)
+    parser.add_argument("--max-p99-overhead-ms", type=float)
+    parser.add_argument("--max-fds", type=int)
+    parser.add_argument("--max-rss-mb", type=float)
+    args = parser.parse_args()
+
+    resource.setrlimit(resource.RLIMIT_NOFILE, _raised_nofile_limit())
+    report = asyncio.run(run(args))
+    failures = check_thresholds(args, report)
+    report["failures"] = failures
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,243 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import List, Optional, Dict, Any
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from pydantic import ValidationError
+from typing import AsyncIterator, Iterable, List, Optional, Dict, Any, Set, Tuple
 from datetime import datetime, timedelta
+import asyncio
+import base64
+import hashlib
+import json
+import logging
 import os
+import secrets
 
-from models import Site, CheckResult, User, SiteStats, DashboardStats, SiteStatus
+from models import (
+    Site, CheckResult, CheckHistoryPage, User, SiteStats, DashboardStats, SiteStatus, LatencyPercentiles,
+    Incident, ReliabilityReport
+)
+from services.analytics import CheckSeries
+from services.cache import TTLCache
+from services.incidents import IncidentChange
+from services.quantiles import MIN_VALUE as MIN_SKETCH_VALUE, ZERO_KEY as ZERO_SKETCH_KEY
+from services.quantiles import LatencySketch, merge_sketches
+
+logger = logging.getLogger(__name__)
+
+# Коллекции предагрегированных счетчиков: единица времени -> коллекция
+ROLLUP_COLLECTIONS = {"hour": "checks_hourly", "day": "checks_daily"}
+STATUS_COUNTERS = {
+    SiteStatus.ONLINE: "online",
+    SiteStatus.WARNING: "warning",
+    SiteStatus.OFFLINE: "offline",
+    SiteStatus.UNKNOWN: "unknown",
+}
+
+# Временные метрики проверки, для которых в счетчиках хранятся сумма и количество
+TIMING_FIELDS = ("response_time", "dns_time", "connect_time", "total_time")
+BUCKET_SIZES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+EPOCH = datetime(1970, 1, 1)
+# Фрагмент колонок load_check_series: сутки проверок одного сайта в одном документе
+SERIES_CHUNK_MS = 86400 * 1000
+# Корзины моложе этого запаса еще получают живые $inc и не пересчитываются
+ROLLUP_SETTLE_TIME = timedelta(hours=1)
+
+def truncate_to_bucket(moment: datetime, unit: str) -> datetime:
+    """Начало часового или суточного интервала"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+# Код ошибки MongoDB при нарушении уникального индекса (E11000)
+DUPLICATE_KEY_ERROR = 11000
+
+def _failed_indexes(error: BulkWriteError, ignore_codes: Tuple[int, ...] = ()) -> Set[int]:
+    """Номера операций bulk-записи, завершившихся ошибкой (кроме ignore_codes)"""
+    return {
+        write_error["index"] for write_error in error.details.get("writeErrors", [])
+        if write_error.get("code") not in ignore_codes
+    }
+
+class WriteProgress:
+    """Шаги записи результатов, уже выполненные для каждого check id.
+
+    insert_many и $inc в rollup неидемпотентны: при повторе записи пачки
+    после сбоя выполненные шаги пропускаются, а не дублируют данные.
+    """
+    __slots__ = ("inserted", "rolled_up")
+    
+    def __init__(self):
+        self.inserted: Set[str] = set()
+        self.rolled_up: Dict[str, Set[str]] = {unit: set() for unit in ROLLUP_COLLECTIONS}
+    
+    def forget(self, check_ids: Iterable[str]):
+        """Сброс отметок для пачки, запись которой завершена (или отброшена)"""
+        check_ids = set(check_ids)
+        self.inserted -= check_ids
+        for rolled_up in self.rolled_up.values():
+            rolled_up -= check_ids
+
+def _bson_datetime(moment: Optional[datetime]) -> Optional[datetime]:
+    """Время с точностью BSON (миллисекунды) для точного сравнения с сохраненным"""
+    if moment is None:
+        return None
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+def encode_checks_cursor(check_data: Dict[str, Any]) -> str:
+    """Курсор keyset-пагинации по (checked_at, id)"""
+    payload = json.dumps({"t": check_data["checked_at"].isoformat(), "id": check_data["id"]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_checks_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Разбор курсора; ValueError для некорректного значения"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 class DatabaseService:
-    def __init__(self, db):
+    def __init__(
+        self,
+        db,
+        checks_storage: str = "standard",
+        raw_checks_ttl_days: Optional[int] = None,
+        user_cache_size: int = 10000,
+        user_cache_ttl: float = 60.0,
+        stats_cache_size: int = 10000,
+        stats_cache_ttl: float = 30.0,
+    ):
         self.db = db
         self.sites_collection = db.sites
         self.checks_collection = db.checks
         self.users_collection = db.users
+        self.incidents_collection = db.incidents
+        self.sse_tickets_collection = db.sse_tickets
+        self.rollup_collections = {unit: db[name] for unit, name in ROLLUP_COLLECTIONS.items()}
+        # Режим хранения сырых проверок: "standard" или "timeseries"
+        self.checks_storage = checks_storage
+        self.raw_checks_ttl_days = raw_checks_ttl_days
+        self.checks_timeseries = False
+        # Кэш пользователей для get_current_user: user_id -> User
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # Кэши статистики; сбрасываются при записи результатов и изменении сайтов
+        self.site_stats_cache = TTLCache(maxsize=stats_cache_size, ttl=stats_cache_ttl)
+        self.dashboard_cache = TTLCache(maxsize=stats_cache_size, ttl=stats_cache_ttl)
+        self._site_owners: Dict[str, str] = {}
+        # Скетч квантилей времени ответа, корзины хранятся в rollup-документах
+        self.latency_sketch = LatencySketch()
+    
+    def invalidate_site(self, site_id: str, owner_id: Optional[str] = None):
+        """Сброс закэшированной статистики сайта и дашборда его владельца"""
+        self.site_stats_cache.pop(site_id)
+        owner_id = owner_id or self._site_owners.get(site_id)
+        if owner_id:
+            self.dashboard_cache.pop(owner_id)
+    
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики попаданий/промахов кэшей сервиса"""
+        return {
+            "users": self.user_cache.stats(),
+            "site_stats": self.site_stats_cache.stats(),
+            "dashboard": self.dashboard_cache.stats(),
+        }
+    
+    async def setup_checks_storage(self) -> str:
+        """Определение (и при необходимости создание) хранилища проверок"""
+        cursor = await self.db.list_collections(filter={"name": "checks"})
+        existing = await cursor.to_list(1)
+        ttl_seconds = self.raw_checks_ttl_days * 86400 if self.raw_checks_ttl_days else None
+        
+        if not existing and self.checks_storage == "timeseries":
+            options: Dict[str, Any] = {
+                "timeseries": {"timeField": "checked_at", "metaField": "site_id", "granularity": "minutes"}
+            }
+            if ttl_seconds:
+                options["expireAfterSeconds"] = ttl_seconds
+            await self.db.create_collection("checks", **options)
+            logger.info("Created time-series checks collection")
+            self.checks_timeseries = True
+        elif existing:
+            self.checks_timeseries = existing[0].get("type") == "timeseries"
+            if self.checks_storage == "timeseries" and not self.checks_timeseries:
+                logger.warning(
+                    "CHECKS_STORAGE=timeseries but 'checks' is a regular collection; "
+                    "migrate the data to enable time-series storage"
+                )
+            if self.checks_timeseries and ttl_seconds:
+                # Срок хранения сырых данных можно менять на существующей коллекции
+                await self.db.command("collMod", "checks", expireAfterSeconds=ttl_seconds)
+        
+        return "timeseries" if self.checks_timeseries else "standard"
+    
+    def _index_models(self) -> Dict[str, List[IndexModel]]:
+        """Индексы, необходимые для запросов сервиса"""
+        checks_indexes = [
+            IndexModel([("site_id", ASCENDING), ("checked_at", DESCENDING)], name="site_id_checked_at"),
+            IndexModel([("checked_at", DESCENDING)], name="checked_at"),
+        ]
+        if not self.checks_timeseries:
+            # Повтор insert_many после сбоя не создаст дубликатов (time-series не поддерживает unique)
+            checks_indexes.append(IndexModel([("id", ASCENDING)], name="id_unique", unique=True))
+        return {
+            "sites": [
+                IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                IndexModel([("owner_id", ASCENDING)], name="owner_id"),
+            ],
+            "checks": checks_indexes,
+            "users": [
+                IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+                IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+            ],
+            "incidents": [
+                IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                IndexModel([("site_id", ASCENDING), ("started_at", DESCENDING)], name="site_id_started_at"),
+                IndexModel([("owner_id", ASCENDING), ("started_at", DESCENDING)], name="owner_id_started_at"),
+                # Открытые инциденты: загрузка состояния движка и счетчик на дашборде
+                IndexModel(
+                    [("site_id", ASCENDING)], name="open_site_id",
+                    partialFilterExpression={"resolved_at": None}
+                ),
+            ],
+            # Просроченные билеты SSE удаляются TTL-монитором
+            "sse_tickets": [IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)],
+            **{
+                name: [IndexModel([("site_id", ASCENDING), ("bucket", ASCENDING)], name="site_id_bucket_unique", unique=True)]
+                for name in ROLLUP_COLLECTIONS.values()
+            },
+        }
+    
+    async def ensure_indexes(self) -> Dict[str, List[str]]:
+        """Создание индексов (идемпотентно, безопасно при каждом запуске)"""
+        # Коллекция проверок должна быть создана до индексов, иначе она станет обычной
+        await self.setup_checks_storage()
+        created = {}
+        for collection_name, indexes in self._index_models().items():
+            try:
+                created[collection_name] = await self.db[collection_name].create_indexes(indexes)
+            except OperationFailure as e:
+                # Например, дубликаты мешают построить уникальный индекс
+                logger.error("Failed to create indexes on %s: %s", collection_name, e)
+                created[collection_name] = []
+        return created
+    
+    async def get_index_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Статистика использования индексов ($indexStats)"""
+        stats = {}
+        for collection_name in self._index_models():
+            cursor = self.db[collection_name].aggregate([{"$indexStats": {}}])
+            stats[collection_name] = [
+                {
+                    "name": index["name"],
+                    "key": dict(index["key"]),
+                    "ops": index["accesses"]["ops"],
+                    "since": index["accesses"]["since"],
+                }
+                async for index in cursor
+            ]
+        return stats
     
     # Методы для работы с сайтами
     async def create_site(self, site: Site) -> Site:
@@ -20,6 +247,8 @@ class DatabaseService:
         if 'url' in site_dict and hasattr(site_dict['url'], '__str__'):
             site_dict['url'] = str(site_dict['url'])
         await self.sites_collection.insert_one(site_dict)
+        self._site_owners[site.id] = site.owner_id
+        self.invalidate_site(site.id)
         return site
     
     async def get_site(self, site_id: str) -> Optional[Site]:
@@ -29,18 +258,21 @@ class DatabaseService:
     
     async def get_sites_by_user(self, user_id: str) -> List[Site]:
         """Получение всех сайтов пользователя"""
-        cursor = self.sites_collection.find({"owner_id": user_id})
-        sites = []
-        async for site_data in cursor:
-            sites.append(Site(**site_data))
-        return sites
+        return await self._load_sites(self.sites_collection.find({"owner_id": user_id}))
     
     async def get_all_sites(self) -> List[Site]:
         """Получение всех сайтов"""
-        cursor = self.sites_collection.find({})
+        return await self._load_sites(self.sites_collection.find({}))
+    
+    @staticmethod
+    async def _load_sites(cursor) -> List[Site]:
+        """Чтение сайтов из курсора: поврежденный документ пропускается, а не ломает весь список"""
         sites = []
         async for site_data in cursor:
-            sites.append(Site(**site_data))
+            try:
+                sites.append(Site(**site_data))
+            except ValidationError as e:
+                logger.error("Skipping invalid site document %s: %s", site_data.get("id"), e)
         return sites
     
     async def update_site(self, site_id: str, update_data: dict) -> Optional[Site]:
@@ -54,20 +286,244 @@ class DatabaseService:
             {"$set": update_data},
             return_document=True
         )
+        self.invalidate_site(site_id, result["owner_id"] if result else None)
         return Site(**result) if result else None
     
     async def delete_site(self, site_id: str) -> bool:
         """Удаление сайта"""
-        result = await self.sites_collection.delete_one({"id": site_id})
-        return result.deleted_count > 0
+        result = await self.sites_collection.find_one_and_delete({"id": site_id}, {"owner_id": 1})
+        self.invalidate_site(site_id, result["owner_id"] if result else None)
+        self._site_owners.pop(site_id, None)
+        return result is not None
     
     # Методы для работы с проверками
     async def save_check_result(self, check_result: CheckResult) -> CheckResult:
         """Сохранение результата проверки"""
         check_dict = check_result.dict()
         await self.checks_collection.insert_one(check_dict)
+        await self.update_rollups([check_result])
+        self.invalidate_site(check_result.site_id)
         return check_result
     
+    async def save_check_results(
+        self, check_results: List[CheckResult], progress: Optional[WriteProgress] = None
+    ) -> List[CheckResult]:
+        """Пакетное сохранение результатов проверок одним insert_many.
+
+        С progress запись можно повторять после сбоя: уже вставленные проверки
+        не вставляются снова (повтор после обрыва связи отсекает уникальный
+        индекс по id), а в rollup учитываются ровно один раз.
+        """
+        if not check_results:
+            return check_results
+        progress = progress or WriteProgress()
+        pending = [check_result for check_result in check_results if check_result.id not in progress.inserted]
+        insert_error = None
+        if pending:
+            try:
+                await self.checks_collection.insert_many(
+                    [check_result.dict() for check_result in pending],
+                    ordered=False
+                )
+                failed: Set[int] = set()
+            except BulkWriteError as e:
+                # Дубликат означает, что проверка уже записана предыдущей попыткой
+                failed = _failed_indexes(e, ignore_codes=(DUPLICATE_KEY_ERROR,))
+                if failed:
+                    insert_error = e
+            progress.inserted.update(
+                check_result.id for index, check_result in enumerate(pending) if index not in failed
+            )
+        await self.update_rollups(
+            [check_result for check_result in check_results if check_result.id in progress.inserted],
+            progress
+        )
+        for site_id in {check_result.site_id for check_result in check_results}:
+            self.invalidate_site(site_id)
+        if insert_error is not None:
+            raise insert_error
+        return check_results
+    
+    async def update_rollups(self, check_results: List[CheckResult], progress: Optional[WriteProgress] = None):
+        """Инкрементальное обновление часовых и суточных счетчиков ($inc upsert)"""
+        for unit, collection in self.rollup_collections.items():
+            rolled_up = progress.rolled_up[unit] if progress is not None else set()
+            # Сначала сворачиваем пачку в памяти: одна операция на (сайт, интервал)
+            buckets: Dict[tuple, Dict[str, Any]] = {}
+            for check_result in check_results:
+                if check_result.id in rolled_up:
+                    continue
+                key = (check_result.site_id, truncate_to_bucket(check_result.checked_at, unit))
+                bucket = buckets.setdefault(key, {"inc": {}, "min": None, "max": None, "ids": []})
+                bucket["ids"].append(check_result.id)
+                inc = bucket["inc"]
+                inc["total"] = inc.get("total", 0) + 1
+                counter = STATUS_COUNTERS[check_result.status]
+                inc[counter] = inc.get(counter, 0) + 1
+                for field in TIMING_FIELDS:
+                    value = getattr(check_result, field)
+                    if value is not None:
+                        inc[f"{field}_sum"] = inc.get(f"{field}_sum", 0) + value
+                        inc[f"{field}_count"] = inc.get(f"{field}_count", 0) + 1
+                response_time = check_result.response_time
+                if response_time is not None:
+                    sketch_field = f"latency_sketch.{self.latency_sketch.key(response_time)}"
+                    inc[sketch_field] = inc.get(sketch_field, 0) + 1
+                    bucket["min"] = response_time if bucket["min"] is None else min(bucket["min"], response_time)
+                    bucket["max"] = response_time if bucket["max"] is None else max(bucket["max"], response_time)
+            
+            operations = []
+            operation_ids = []
+            for (site_id, bucket_start), bucket in buckets.items():
+                update: Dict[str, Any] = {"$inc": bucket["inc"]}
+                if bucket["min"] is not None:
+                    update["$min"] = {"response_time_min": bucket["min"]}
+                    update["$max"] = {"response_time_max": bucket["max"]}
+                operations.append(UpdateOne({"site_id": site_id, "bucket": bucket_start}, update, upsert=True))
+                operation_ids.append(bucket["ids"])
+            if not operations:
+                continue
+            try:
+                await collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Примененные корзины отмечаем, чтобы повтор не прибавил их дважды
+                failed = _failed_indexes(e)
+                for index, ids in enumerate(operation_ids):
+                    if index not in failed:
+                        rolled_up.update(ids)
+                raise
+            for ids in operation_ids:
+                rolled_up.update(ids)
+    
+    async def backfill_rollups(self) -> bool:
+        """Первичное заполнение пустых rollup из сырых проверок; вызывается до запуска планировщика"""
+        if await self.rollup_collections["day"].find_one({}, {"_id": 1}) is not None:
+            return False
+        if await self.checks_collection.find_one({}, {"_id": 1}) is None:
+            return False
+        # Живых $inc еще нет, поэтому пересчитываются все корзины, включая текущие
+        await self.rebuild_rollups(since=datetime(1970, 1, 1), until=datetime.utcnow())
+        return True
+    
+    async def rebuild_rollups(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> None:
+        """Пересчет счетчиков из сырых проверок (для данных, сохраненных до появления rollup).
+
+        По умолчанию заменяются только закрытые корзины (старше ROLLUP_SETTLE_TIME),
+        в которые уже не пишут живые $inc, и только целиком покрытые сырыми данными:
+        при raw_checks_ttl_days более старые корзины частично удалены по TTL,
+        и пересчет заменил бы полные счетчики заниженными.
+        """
+        now = datetime.utcnow()
+        for unit, name in ROLLUP_COLLECTIONS.items():
+            start = since
+            if start is None and self.raw_checks_ttl_days:
+                horizon = now - timedelta(days=self.raw_checks_ttl_days)
+                start = truncate_to_bucket(horizon, unit) + BUCKET_SIZES[unit]
+            end = until or truncate_to_bucket(now - ROLLUP_SETTLE_TIME, unit)
+            if start is not None and start >= end:
+                continue
+            checked_at = {"$lt": end}
+            if start is not None:
+                checked_at["$gte"] = start
+            
+            status_sums = {
+                counter: {"$sum": {"$cond": [{"$eq": ["$status", status.value]}, 1, 0]}}
+                for status, counter in STATUS_COUNTERS.items()
+            }
+            timing_sums = {}
+            for field in TIMING_FIELDS:
+                timing_sums[f"{field}_sum"] = {"$sum": {"$ifNull": [f"${field}", 0]}}
+                timing_sums[f"{field}_count"] = {"$sum": {"$cond": [{"$gt": [f"${field}", None]}, 1, 0]}}
+            pipeline = [
+                {"$match": {"checked_at": checked_at}},
+                {"$group": {
+                    "_id": {
+                        "site_id": "$site_id",
+                        "bucket": {"$dateTrunc": {"date": "$checked_at", "unit": unit}}
+                    },
+                    "total": {"$sum": 1},
+                    **status_sums,
+                    **timing_sums,
+                    "response_time_min": {"$min": "$response_time"},
+                    "response_time_max": {"$max": "$response_time"}
+                }},
+                {"$replaceWith": {"$mergeObjects": [
+                    "$_id",
+                    {"$unsetField": {"field": "_id", "input": "$$ROOT"}}
+                ]}},
+                {"$merge": {"into": name, "on": ["site_id", "bucket"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+            ]
+            await self.checks_collection.aggregate(pipeline).to_list(None)
+            
+            # Корзины скетча квантилей: ключ = ceil(ln(rt) / ln(gamma)), см. LatencySketch.key
+            sketch_key = {"$cond": [
+                {"$lt": ["$response_time", MIN_SKETCH_VALUE]},
+                ZERO_SKETCH_KEY,
+                {"$toString": {"$toInt": {"$ceil": {
+                    "$divide": [{"$ln": "$response_time"}, self.latency_sketch.log_gamma]
+                }}}}
+            ]}
+            sketch_pipeline = [
+                {"$match": {"checked_at": checked_at, "response_time": {"$ne": None}}},
+                {"$group": {
+                    "_id": {
+                        "site_id": "$site_id",
+                        "bucket": {"$dateTrunc": {"date": "$checked_at", "unit": unit}},
+                        "key": sketch_key
+                    },
+                    "count": {"$sum": 1}
+                }},
+                {"$group": {
+                    "_id": {"site_id": "$_id.site_id", "bucket": "$_id.bucket"},
+                    "bins": {"$push": {"k": "$_id.key", "v": "$count"}}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "site_id": "$_id.site_id",
+                    "bucket": "$_id.bucket",
+                    "latency_sketch": {"$arrayToObject": "$bins"}
+                }},
+                {"$merge": {"into": name, "on": ["site_id", "bucket"], "whenMatched": "merge", "whenNotMatched": "insert"}}
+            ]
+            await self.checks_collection.aggregate(sketch_pipeline).to_list(None)
+    
+    async def update_sites_status(self, check_results: List[CheckResult]) -> int:
+        """Пакетное обновление статусов сайтов одним bulk_write"""
+        # Для каждого сайта берем самый свежий результат
+        latest: Dict[str, CheckResult] = {}
+        for check_result in check_results:
+            current = latest.get(check_result.site_id)
+            if current is None or check_result.checked_at >= current.checked_at:
+                latest[check_result.site_id] = check_result
+        if not latest:
+            return 0
+        
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"id": site_id}, {"$set": {
+                "status": check_result.status,
+                "last_check": check_result.checked_at,
+                "response_time": check_result.response_time,
+                "updated_at": now
+            }})
+            for site_id, check_result in latest.items()
+        ]
+        result = await self.sites_collection.bulk_write(operations, ordered=False)
+        for site_id in latest:
+            self.invalidate_site(site_id)
+        return result.modified_count
+    
+    async def record_check_results(
+        self, check_results: List[CheckResult], progress: Optional[WriteProgress] = None
+    ) -> List[CheckResult]:
+        """Сохранение пачки результатов и обновление статусов сайтов (2 запроса на пачку).
+
+        Повтор с тем же progress безопасен: обновление статусов - идемпотентный $set.
+        """
+        await self.save_check_results(check_results, progress)
+        await self.update_sites_status(check_results)
+        return check_results
+    
     async def get_site_checks(self, site_id: str, limit: int = 100) -> List[CheckResult]:
         """Получение проверок для сайта"""
         cursor = self.checks_collection.find({"site_id": site_id}).sort("checked_at", -1).limit(limit)
@@ -76,6 +532,96 @@ class DatabaseService:
             checks.append(CheckResult(**check_data))
         return checks
     
+    def _checks_range_query(
+        self, site_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"site_id": site_id}
+        if since or until:
+            query["checked_at"] = {}
+            if since:
+                query["checked_at"]["$gte"] = since
+            if until:
+                query["checked_at"]["$lt"] = until
+        return query
+    
+    async def get_site_checks_page(
+        self,
+        site_id: str,
+        limit: int = 100,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> CheckHistoryPage:
+        """Страница истории проверок (keyset-пагинация, от новых к старым)"""
+        query = self._checks_range_query(site_id, since, until)
+        direction = -1
+        if before or after:
+            checked_at, check_id = decode_checks_cursor(before or after)
+            op = "$lt" if before else "$gt"
+            query["$or"] = [
+                {"checked_at": {op: checked_at}},
+                {"checked_at": checked_at, "id": {op: check_id}},
+            ]
+            if after:
+                # Более новые записи читаем по возрастанию и затем разворачиваем
+                direction = 1
+        
+        cursor = self.checks_collection.find(query, {"_id": 0}).sort(
+            [("checked_at", direction), ("id", direction)]
+        ).limit(limit + 1)
+        documents = await cursor.to_list(limit + 1)
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+        if direction == 1:
+            documents.reverse()
+        
+        next_cursor = prev_cursor = None
+        if documents:
+            older_exist = has_more if direction == -1 else True
+            newer_exist = bool(before) or (after is not None and has_more)
+            next_cursor = encode_checks_cursor(documents[-1]) if older_exist else None
+            prev_cursor = encode_checks_cursor(documents[0]) if newer_exist else None
+        
+        return CheckHistoryPage(
+            items=[CheckResult(**check_data) for check_data in documents],
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor
+        )
+    
+    async def iter_site_checks(
+        self, site_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Потоковое чтение сырых проверок из курсора (без буферизации всей истории)"""
+        cursor = self.checks_collection.find(
+            self._checks_range_query(site_id, since, until), {"_id": 0}
+        ).sort("checked_at", 1).batch_size(1000)
+        async for check_data in cursor:
+            yield check_data
+    
+    async def load_check_series(
+        self, site_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None
+    ) -> CheckSeries:
+        """Загрузка истории проверок в колоночные массивы.
+
+        Колонки собираются в MongoDB по суткам ($push в $group), поэтому
+        драйвер возвращает несколько документов со списками вместо документа
+        на каждую проверку, а массивы NumPy строятся из списков целиком.
+        """
+        epoch_ms = {"$subtract": ["$checked_at", EPOCH]}
+        pipeline = [
+            {"$match": self._checks_range_query(site_id, since, until)},
+            {"$group": {
+                "_id": {"$floor": {"$divide": [epoch_ms, SERIES_CHUNK_MS]}},
+                "epoch_ms": {"$push": epoch_ms},
+                "online": {"$push": {"$eq": ["$status", SiteStatus.ONLINE.value]}},
+                "status_code": {"$push": {"$ifNull": ["$status_code", -1]}},
+                "response_time": {"$push": {"$ifNull": ["$response_time", None]}},
+            }},
+        ]
+        chunks = await self.checks_collection.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        return CheckSeries.from_column_chunks(chunks)
+    
     async def get_recent_checks(self, site_id: str, hours: int = 24) -> List[CheckResult]:
         """Получение недавних проверок"""
         since = datetime.utcnow() - timedelta(hours=hours)
@@ -107,91 +653,355 @@ class DatabaseService:
         return User(**user_data) if user_data else None
     
     async def get_user_by_id(self, user_id: str) -> Optional[User]:
-        """Получение пользователя по ID"""
+        """Получение пользователя по ID (с кэшированием)"""
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            return user
         user_data = await self.users_collection.find_one({"id": user_id})
-        return User(**user_data) if user_data else None
+        if not user_data:
+            return None
+        user = User(**user_data)
+        self.user_cache.set(user_id, user)
+        return user
+    
+    async def update_user(self, user_id: str, update_data: dict) -> Optional[User]:
+        """Обновление пользователя"""
+        update_data["updated_at"] = datetime.utcnow()
+        result = await self.users_collection.find_one_and_update(
+            {"id": user_id},
+            {"$set": update_data},
+            return_document=True
+        )
+        self.invalidate_user(user_id)
+        return User(**result) if result else None
+    
+    async def deactivate_user(self, user_id: str) -> Optional[User]:
+        """Деактивация пользователя"""
+        return await self.update_user(user_id, {"is_active": False})
+    
+    def invalidate_user(self, user_id: str):
+        """Сброс пользователя из кэша (вызывать при любом изменении пользователя)"""
+        self.user_cache.pop(user_id)
+    
+    # Билеты для подключения к SSE
+    async def create_sse_ticket(self, user_id: str, ttl: float) -> str:
+        """Короткоживущий одноразовый билет; в базе хранится только его хэш"""
+        ticket = secrets.token_urlsafe(32)
+        await self.sse_tickets_collection.insert_one({
+            "_id": hashlib.sha256(ticket.encode("utf-8")).hexdigest(),
+            "user_id": user_id,
+            "expires_at": datetime.utcnow() + timedelta(seconds=ttl),
+        })
+        return ticket
+    
+    async def redeem_sse_ticket(self, ticket: str) -> Optional[str]:
+        """Погашение билета: user_id или None, если билет неизвестен, использован или истек"""
+        ticket_data = await self.sse_tickets_collection.find_one_and_delete({
+            "_id": hashlib.sha256(ticket.encode("utf-8")).hexdigest(),
+            # TTL-монитор удаляет записи с задержкой, поэтому срок проверяется и здесь
+            "expires_at": {"$gt": datetime.utcnow()},
+        })
+        return ticket_data["user_id"] if ticket_data else None
+    
+    # Методы для работы с инцидентами
+    async def save_incidents(self, changes: List[IncidentChange]) -> List[str]:
+        """Запись изменений инцидентов; возвращает id изменений, не примененных как устаревшие.
+
+        Поля пишутся по отдельности ($setOnInsert/$inc/$max), а изменение
+        применяется, только если инцидент в базе в том же состоянии (открыт
+        или закрыт в то же время), от которого его считал процесс. Так копия
+        в памяти API или другого воркера не перезапишет более новое состояние.
+        """
+        if not changes:
+            return []
+        applied = await asyncio.gather(*(self._save_incident(change) for change in changes))
+        for change in changes:
+            self.dashboard_cache.pop(change.incident.owner_id)
+        return [change.incident.id for change, ok in zip(changes, applied) if not ok]
+    
+    async def _save_incident(self, change: IncidentChange) -> bool:
+        incident = change.incident
+        update = {
+            "$set": {"resolved_at": incident.resolved_at},
+            "$max": {"last_check_at": incident.last_check_at},
+            "$inc": {"failed_checks": change.failed_checks, "flap_count": change.flap_count},
+        }
+        if incident.error_message is not None:
+            update["$set"]["error_message"] = incident.error_message
+        if change.is_new:
+            update["$set"]["status"] = incident.status
+            update["$setOnInsert"] = {
+                "id": incident.id,
+                "site_id": incident.site_id,
+                "owner_id": incident.owner_id,
+                "started_at": incident.started_at,
+                "confirmed_at": incident.confirmed_at,
+            }
+            await self.incidents_collection.update_one({"id": incident.id}, update, upsert=True)
+            return True
+        if incident.status == SiteStatus.OFFLINE:
+            # Статус инцидента только повышается до OFFLINE
+            update["$set"]["status"] = incident.status
+        result = await self.incidents_collection.update_one(
+            {"id": incident.id, "resolved_at": _bson_datetime(change.base_resolved_at)},
+            update
+        )
+        return result.matched_count > 0
+    
+    async def get_open_incidents(self, site_ids: List[str]) -> Dict[str, Incident]:
+        """Открытые инциденты сайтов: site_id -> Incident"""
+        cursor = self.incidents_collection.find({"site_id": {"$in": site_ids}, "resolved_at": None}, {"_id": 0})
+        return {incident_data["site_id"]: Incident(**incident_data) async for incident_data in cursor}
+    
+    async def get_incidents(
+        self,
+        owner_id: Optional[str] = None,
+        site_id: Optional[str] = None,
+        open_only: bool = False,
+        limit: int = 50,
+    ) -> List[Incident]:
+        """Последние инциденты пользователя или сайта"""
+        query: Dict[str, Any] = {}
+        if owner_id is not None:
+            query["owner_id"] = owner_id
+        if site_id is not None:
+            query["site_id"] = site_id
+        if open_only:
+            query["resolved_at"] = None
+        cursor = self.incidents_collection.find(query, {"_id": 0}).sort("started_at", DESCENDING).limit(limit)
+        return [Incident(**incident_data) async for incident_data in cursor]
+    
+    async def get_reliability_report(
+        self, site_id: str, since: datetime, until: Optional[datetime] = None
+    ) -> ReliabilityReport:
+        """MTTR/MTBF и время простоя за окно по коллекции инцидентов"""
+        until = until or datetime.utcnow()
+        cursor = self.incidents_collection.find(
+            {
+                "site_id": site_id,
+                "started_at": {"$lt": until},
+                "$or": [{"resolved_at": None}, {"resolved_at": {"$gt": since}}],
+            },
+            {"_id": 0, "started_at": 1, "resolved_at": 1}
+        )
+        incidents = 0
+        open_incidents = 0
+        downtime = 0.0
+        repair_times = []
+        async for incident_data in cursor:
+            incidents += 1
+            resolved_at = incident_data.get("resolved_at")
+            if resolved_at is None:
+                open_incidents += 1
+            else:
+                repair_times.append((resolved_at - incident_data["started_at"]).total_seconds())
+            # Простой учитывается только в пределах окна
+            start = max(incident_data["started_at"], since)
+            end = min(resolved_at or until, until)
+            downtime += max(0.0, (end - start).total_seconds())
+        
+        window = (until - since).total_seconds()
+        return ReliabilityReport(
+            site_id=site_id,
+            since=since,
+            until=until,
+            incidents=incidents,
+            open_incidents=open_incidents,
+            downtime_seconds=downtime,
+            uptime_percentage=(1 - downtime / window) * 100 if window > 0 else 100.0,
+            mttr_seconds=sum(repair_times) / len(repair_times) if repair_times else None,
+            mtbf_seconds=(window - downtime) / incidents if incidents else None
+        )
     
     # Методы для статистики
+    async def get_latency_percentiles(
+        self, site_id: str, since: datetime, until: Optional[datetime] = None
+    ) -> LatencyPercentiles:
+        """Перцентили времени ответа за произвольное окно (слияние скетчей из rollup)"""
+        until = until or datetime.utcnow()
+        # Для длинных окон достаточно суточной гранулярности
+        unit = "hour" if until - since <= timedelta(days=7) else "day"
+        cursor = self.rollup_collections[unit].find(
+            {"site_id": site_id, "bucket": {"$gte": truncate_to_bucket(since, unit), "$lt": until}},
+            {"_id": 0, "latency_sketch": 1}
+        )
+        sketch = merge_sketches([bucket.get("latency_sketch") async for bucket in cursor])
+        percentiles = sketch.quantiles([0.5, 0.95, 0.99])
+        return LatencyPercentiles(
+            site_id=site_id,
+            since=since,
+            until=until,
+            count=sketch.count,
+            p50=percentiles[0.5],
+            p95=percentiles[0.95],
+            p99=percentiles[0.99]
+        )
+    
     async def get_site_stats(self, site_id: str) -> SiteStats:
-        """Получение статистики для сайта"""
-        # Получаем все проверки для сайта
-        checks = await self.get_site_checks(site_id, limit=1000)
-        
-        # Считаем статистику
-        total_checks = len(checks)
-        successful_checks = sum(1 for check in checks if check.status == SiteStatus.ONLINE)
-        failed_checks = total_checks - successful_checks
+        """Получение статистики для сайта (с кэшированием)"""
+        stats = self.site_stats_cache.get(site_id)
+        if stats is None:
+            stats = await self._compute_site_stats(site_id)
+            self.site_stats_cache.set(site_id, stats)
+        return stats
+    
+    async def _compute_site_stats(self, site_id: str) -> SiteStats:
+        """Расчет статистики для сайта (по суточным счетчикам)"""
+        today_start = truncate_to_bucket(datetime.utcnow(), "day")
+        trend_start = today_start - timedelta(days=6)
         
-        response_times = [check.response_time for check in checks if check.response_time is not None]
-        avg_response_time = sum(response_times) / len(response_times) if response_times else 0
+        pipeline = [
+            {"$match": {"site_id": site_id}},
+            {"$facet": {
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "total": {"$sum": "$total"},
+                        "successful": {"$sum": "$online"},
+                        **{
+                            f"{field}_{part}": {"$sum": f"${field}_{part}"}
+                            for field in TIMING_FIELDS for part in ("sum", "count")
+                        }
+                    }}
+                ],
+                "trend": [
+                    {"$match": {"bucket": {"$gte": trend_start}}},
+                    {"$project": {"_id": 0, "bucket": 1, "total": 1, "online": 1, "latency_sketch": 1}}
+                ]
+            }}
+        ]
+        rollups, last_24h_checks = await asyncio.gather(
+            self.rollup_collections["day"].aggregate(pipeline).to_list(1),
+            self.get_recent_checks(site_id, hours=24)
+        )
+        facets = rollups[0]
         
+        totals = facets["totals"][0] if facets["totals"] else {}
+        total_checks = totals.get("total", 0)
+        successful_checks = totals.get("successful", 0)
+        averages = {
+            field: totals[f"{field}_sum"] / totals[f"{field}_count"] if totals.get(f"{field}_count") else None
+            for field in TIMING_FIELDS
+        }
         uptime_percentage = (successful_checks / total_checks * 100) if total_checks > 0 else 0
         
-        # Получаем проверки за последние 24 часа
-        last_24h_checks = await self.get_recent_checks(site_id, hours=24)
-        
-        # Создаем тренд uptime (последние 7 дней)
+        # Тренд uptime по календарным дням (последние 7 дней, начиная с сегодняшнего)
+        days = {bucket["bucket"]: bucket for bucket in facets["trend"]}
         uptime_trend = []
         for i in range(7):
-            day_start = datetime.utcnow() - timedelta(days=i+1)
-            day_end = datetime.utcnow() - timedelta(days=i)
-            
-            day_checks = [check for check in checks if day_start <= check.checked_at <= day_end]
-            day_successful = sum(1 for check in day_checks if check.status == SiteStatus.ONLINE)
-            day_uptime = (day_successful / len(day_checks) * 100) if day_checks else 0
-            
+            day = today_start - timedelta(days=i)
+            bucket = days.get(day)
+            day_uptime = (bucket.get("online", 0) / bucket["total"] * 100) if bucket else 0
             uptime_trend.append({
-                "date": day_start.strftime("%Y-%m-%d"),
+                "date": day.strftime("%Y-%m-%d"),
                 "uptime": day_uptime
             })
         
+        # Перцентили времени ответа за те же 7 дней - слиянием суточных скетчей
+        sketch = merge_sketches(bucket.get("latency_sketch") for bucket in facets["trend"])
+        percentiles = sketch.quantiles([0.5, 0.95, 0.99])
+        
         return SiteStats(
             site_id=site_id,
             total_checks=total_checks,
             successful_checks=successful_checks,
-            failed_checks=failed_checks,
-            average_response_time=avg_response_time,
+            failed_checks=total_checks - successful_checks,
+            average_response_time=averages["response_time"] or 0,
+            average_dns_time=averages["dns_time"],
+            average_connect_time=averages["connect_time"],
+            average_total_time=averages["total_time"],
+            p50_response_time=percentiles[0.5],
+            p95_response_time=percentiles[0.95],
+            p99_response_time=percentiles[0.99],
             uptime_percentage=uptime_percentage,
             last_24h_checks=last_24h_checks,
             uptime_trend=uptime_trend
         )
     
     async def get_dashboard_stats(self, user_id: str) -> DashboardStats:
-        """Получение статистики для дашборда"""
-        sites = await self.get_sites_by_user(user_id)
+        """Получение статистики для дашборда (с кэшированием)"""
+        stats = self.dashboard_cache.get(user_id)
+        if stats is None:
+            stats = await self._compute_dashboard_stats(user_id)
+            self.dashboard_cache.set(user_id, stats)
+        return stats
+    
+    async def _compute_dashboard_stats(self, user_id: str) -> DashboardStats:
+        """Расчет статистики для дашборда (без запросов на каждый сайт)"""
+        # Текущий статус берется из документа сайта (его ведет update_sites_status),
+        # а не сортировкой сырых проверок всех сайтов пользователя
+        sites = await self.sites_collection.find(
+            {"owner_id": user_id}, {"_id": 0, "id": 1, "status": 1, "last_check": 1}
+        ).to_list(None)
+        site_ids = [site_data["id"] for site_data in sites]
+        for site_id in site_ids:
+            self._site_owners[site_id] = user_id
+        total_sites = len(site_ids)
+        
+        now = datetime.utcnow()
+        today_start = truncate_to_bucket(now, "day")
+        
+        # Uptime по сайтам и число проверок за сегодня - из суточных счетчиков
+        rollup_pipeline = [
+            {"$match": {"site_id": {"$in": site_ids}}},
+            {"$facet": {
+                "uptime": [
+                    {"$group": {"_id": "$site_id", "total": {"$sum": "$total"}, "successful": {"$sum": "$online"}}}
+                ],
+                "today": [
+                    {"$match": {"bucket": today_start}},
+                    {"$group": {"_id": None, "count": {"$sum": "$total"}}}
+                ]
+            }}
+        ]
+        facets = {"uptime": [], "today": []}
+        open_incidents = 0
+        if site_ids:
+            rollups, open_incidents = await asyncio.gather(
+                self.rollup_collections["day"].aggregate(rollup_pipeline).to_list(1),
+                self.incidents_collection.count_documents({"site_id": {"$in": site_ids}, "resolved_at": None})
+            )
+            facets = rollups[0]
+        
+        uptime_by_site = {
+            bucket["_id"]: bucket["successful"] / bucket["total"] * 100
+            for bucket in facets["uptime"] if bucket["total"]
+        }
         
-        total_sites = len(sites)
         online_sites = 0
         offline_sites = 0
         warning_sites = 0
-        
-        # Получаем последние проверки для каждого сайта
-        recent_incidents = []
+        offline = []
         total_uptime = 0
         
-        for site in sites:
-            recent_checks = await self.get_recent_checks(site.id, hours=1)
-            if recent_checks:
-                latest_check = recent_checks[0]
-                if latest_check.status == SiteStatus.ONLINE:
-                    online_sites += 1
-                elif latest_check.status == SiteStatus.OFFLINE:
-                    offline_sites += 1
-                    recent_incidents.append(latest_check)
-                else:
-                    warning_sites += 1
-                
-                # Считаем uptime для сайта
-                site_stats = await self.get_site_stats(site.id)
-                total_uptime += site_stats.uptime_percentage
+        # Учитываются сайты, проверенные за последний час
+        checked_since = now - timedelta(hours=1)
+        for site_data in sites:
+            last_check = site_data.get("last_check")
+            if last_check is None or last_check < checked_since:
+                continue
+            site_status = site_data.get("status")
+            if site_status == SiteStatus.ONLINE:
+                online_sites += 1
+            elif site_status == SiteStatus.OFFLINE:
+                offline_sites += 1
+                offline.append(site_data)
+            else:
+                warning_sites += 1
+            total_uptime += uptime_by_site.get(site_data["id"], 0)
         
-        average_uptime = total_uptime / total_sites if total_sites > 0 else 0
+        # Сырые проверки читаются только для последних 10 недоступных сайтов (индекс site_id_checked_at)
+        offline.sort(key=lambda site_data: site_data["last_check"], reverse=True)
+        latest_checks = await asyncio.gather(*(
+            self.checks_collection.find_one(
+                {"site_id": site_data["id"]}, {"_id": 0, "ssl_info": 0}, sort=[("checked_at", DESCENDING)]
+            )
+            for site_data in offline[:10]
+        ))
+        recent_incidents = [CheckResult(**check_data) for check_data in latest_checks if check_data]
         
-        # Считаем общее количество проверок за сегодня
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_checks = await self.checks_collection.count_documents({
-            "checked_at": {"$gte": today_start}
-        })
+        average_uptime = total_uptime / total_sites if total_sites > 0 else 0
+        today_checks = facets["today"][0]["count"] if facets["today"] else 0
         
         return DashboardStats(
             total_sites=total_sites,
@@ -200,5 +1010,6 @@ class DatabaseService:
             warning_sites=warning_sites,
             average_uptime=average_uptime,
             total_checks_today=today_checks,
-            recent_incidents=recent_incidents[:10]  # Последние 10 инцидентов
-        )
\ No newline at end of file
+            recent_incidents=recent_incidents,  # Последние 10 инцидентов
+            open_incidents=open_incidents
+        )
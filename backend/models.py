@@ -10,6 +10,12 @@ class SiteStatus(str, Enum):
     WARNING = "warning"
     UNKNOWN = "unknown"
 
+class ProbeMode(str, Enum):
+    GET = "get"  # GET, небольшое тело дочитывается для keep-alive, большое закрывается
+    HEAD = "head"  # только заголовки
+    GET_CAPPED = "get_capped"  # GET с ограничением прочитанных байт
+    KEYWORD = "keyword"  # потоковый поиск ключевого слова/регулярного выражения
+
 class UserRole(str, Enum):
     USER = "user"
     ADMIN = "admin"
@@ -33,16 +39,38 @@ class Site(BaseModel):
     uptime_percentage: float = 0.0
     response_time: Optional[float] = None
     ssl_expiry: Optional[datetime] = None
+    check_interval: int = Field(default=300, ge=10)  # интервал проверки в секундах
+    # Границы адаптивного интервала; без них сайт проверяется строго с check_interval
+    check_interval_min: Optional[int] = Field(default=None, ge=10)
+    check_interval_max: Optional[int] = Field(default=None, ge=10)
+    probe_mode: ProbeMode = ProbeMode.GET
+    max_body_bytes: Optional[int] = Field(default=None, ge=0)  # лимит чтения тела для get_capped/keyword
+    keyword: Optional[str] = None
+    keyword_is_regex: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class SiteCreate(BaseModel):
     name: str
     url: HttpUrl
+    check_interval: int = Field(default=300, ge=10)
+    check_interval_min: Optional[int] = Field(default=None, ge=10)
+    check_interval_max: Optional[int] = Field(default=None, ge=10)
+    probe_mode: ProbeMode = ProbeMode.GET
+    max_body_bytes: Optional[int] = Field(default=None, ge=0)
+    keyword: Optional[str] = None
+    keyword_is_regex: bool = False
 
 class SiteUpdate(BaseModel):
     name: Optional[str] = None
     url: Optional[HttpUrl] = None
+    check_interval: Optional[int] = Field(default=None, ge=10)
+    check_interval_min: Optional[int] = Field(default=None, ge=10)
+    check_interval_max: Optional[int] = Field(default=None, ge=10)
+    probe_mode: Optional[ProbeMode] = None
+    max_body_bytes: Optional[int] = Field(default=None, ge=0)
+    keyword: Optional[str] = None
+    keyword_is_regex: Optional[bool] = None
 
 class CheckResult(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -53,6 +81,18 @@ class CheckResult(BaseModel):
     error_message: Optional[str] = None
     checked_at: datetime = Field(default_factory=datetime.utcnow)
     ssl_info: Optional[Dict[str, Any]] = None
+    # Разбивка времени проверки по фазам, мс (response_time совпадает с ttfb)
+    dns_time: Optional[float] = None
+    connect_time: Optional[float] = None  # TCP connect вместе с TLS handshake
+    ttfb: Optional[float] = None
+    total_time: Optional[float] = None
+    body_bytes: Optional[int] = None  # прочитано байт тела
+    keyword_found: Optional[bool] = None  # только для режима keyword
+
+class CheckHistoryPage(BaseModel):
+    items: List[CheckResult]
+    next_cursor: Optional[str] = None  # более старые проверки (before)
+    prev_cursor: Optional[str] = None  # более новые проверки (after)
 
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -83,10 +123,26 @@ class SiteStats(BaseModel):
     successful_checks: int
     failed_checks: int
     average_response_time: float
+    average_dns_time: Optional[float] = None
+    average_connect_time: Optional[float] = None
+    average_total_time: Optional[float] = None
+    # Перцентили времени ответа за последние 7 дней
+    p50_response_time: Optional[float] = None
+    p95_response_time: Optional[float] = None
+    p99_response_time: Optional[float] = None
     uptime_percentage: float
     last_24h_checks: List[CheckResult]
     uptime_trend: List[Dict[str, Any]]
 
+class LatencyPercentiles(BaseModel):
+    site_id: str
+    since: datetime
+    until: datetime
+    count: int
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+
 class DashboardStats(BaseModel):
     total_sites: int
     online_sites: int
@@ -94,4 +150,29 @@ class DashboardStats(BaseModel):
     warning_sites: int
     average_uptime: float
     total_checks_today: int
-    recent_incidents: List[CheckResult]
\ No newline at end of file
+    recent_incidents: List[CheckResult]
+    open_incidents: int = 0
+
+class Incident(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    site_id: str
+    owner_id: str
+    status: SiteStatus  # худший статус за время инцидента
+    started_at: datetime  # первая неуспешная проверка
+    confirmed_at: datetime  # проверка, подтвердившая сбой (N из M)
+    resolved_at: Optional[datetime] = None  # первая успешная проверка восстановления
+    last_check_at: datetime
+    failed_checks: int = 0
+    flap_count: int = 0  # сколько раз инцидент переоткрывался вскоре после закрытия
+    error_message: Optional[str] = None
+
+class ReliabilityReport(BaseModel):
+    site_id: str
+    since: datetime
+    until: datetime
+    incidents: int
+    open_incidents: int
+    downtime_seconds: float
+    uptime_percentage: float
+    mttr_seconds: Optional[float] = None  # среднее время восстановления
+    mtbf_seconds: Optional[float] = None  # среднее время работы между сбоями
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -8,15 +9,25 @@ import logging
 from pathlib import Path
 from typing import List, Optional
 import asyncio
-from datetime import datetime
+import json
+import re
+import threading
+from datetime import datetime, timedelta
 
 # Импортируем наши модели и сервисы
 from models import (
     Site, SiteCreate, SiteUpdate, CheckResult, User, UserCreate, UserLogin, Token,
-    SiteStats, DashboardStats, StatusCheck, StatusCheckCreate
+    SiteStats, DashboardStats, StatusCheck, StatusCheckCreate, UserRole, CheckHistoryPage,
+    LatencyPercentiles, ProbeMode, Incident, ReliabilityReport
 )
-from services.monitoring import MonitoringService
-from services.auth import AuthService
+from services.monitoring import MonitoringService, compile_keyword
+from services.auth import AuthService, AuthServiceBusy
+from services.scheduler import CheckScheduler
+from services.intervals import IntervalPolicy
+from services.events import EventHub
+from services.incidents import IncidentEngine
+from services import metrics
+from services.diagnostics import LoopLagMonitor, sample_stacks
 from database import DatabaseService
 
 ROOT_DIR = Path(__file__).parent
@@ -28,9 +39,71 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Инициализация сервисов
-db_service = DatabaseService(db)
-monitoring_service = MonitoringService()
-auth_service = AuthService(secret_key=os.environ.get('SECRET_KEY', 'your-secret-key-here'))
+db_service = DatabaseService(
+    db,
+    checks_storage=os.environ.get('CHECKS_STORAGE', 'standard'),
+    raw_checks_ttl_days=int(os.environ['CHECKS_RAW_TTL_DAYS']) if os.environ.get('CHECKS_RAW_TTL_DAYS') else None,
+    user_cache_size=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+    user_cache_ttl=float(os.environ.get('USER_CACHE_TTL', '60')),
+    stats_cache_size=int(os.environ.get('STATS_CACHE_SIZE', '10000')),
+    stats_cache_ttl=float(os.environ.get('STATS_CACHE_TTL', '30')),
+)
+# Латентность каждого метода DatabaseService в /metrics
+metrics.instrument_async_methods(db_service)
+monitoring_service = MonitoringService(
+    pool_size=int(os.environ.get('PROBE_POOL_SIZE', '1000')),
+    per_host_limit=int(os.environ.get('PROBE_PER_HOST_LIMIT', '10')),
+    keepalive_timeout=float(os.environ.get('PROBE_KEEPALIVE_TIMEOUT', '30')),
+    dns_cache_ttl=int(os.environ.get('PROBE_DNS_CACHE_TTL', '300')),
+    max_concurrency=int(os.environ.get('PROBE_MAX_CONCURRENCY', '200')),
+    per_host_concurrency=int(os.environ.get('PROBE_HOST_CONCURRENCY', '4')),
+    per_host_rate=float(os.environ['PROBE_HOST_RATE']) if os.environ.get('PROBE_HOST_RATE') else None,
+    max_body_bytes=int(os.environ.get('PROBE_MAX_BODY_BYTES', '65536')),
+    get_drain_bytes=int(os.environ.get('PROBE_GET_DRAIN_BYTES', '65536')),
+    keyword_scan_bytes=int(os.environ.get('PROBE_KEYWORD_SCAN_BYTES', '1048576')),
+    request_timeout=float(os.environ.get('PROBE_TIMEOUT', '30')),
+)
+metrics.bind_executor(monitoring_service.executor)
+auth_service = AuthService(
+    secret_key=os.environ.get('SECRET_KEY', 'your-secret-key-here'),
+    token_cache_size=int(os.environ.get('TOKEN_CACHE_SIZE', '10000')),
+    token_cache_ttl=float(os.environ.get('TOKEN_CACHE_TTL', '300')),
+    hash_workers=int(os.environ.get('AUTH_HASH_WORKERS', '4')),
+    max_pending_hashes=int(os.environ.get('AUTH_MAX_PENDING_HASHES', '64')),
+)
+results_batch_size = int(os.environ.get('RESULTS_BATCH_SIZE', '100'))
+scheduler = CheckScheduler(
+    db_service,
+    monitoring_service,
+    rate=float(os.environ.get('SCHEDULER_RATE', '20')),
+    jitter=float(os.environ.get('SCHEDULER_JITTER', '0.1')),
+    max_in_flight=int(os.environ.get('SCHEDULER_MAX_IN_FLIGHT', '100')),
+    refresh_interval=float(os.environ.get('SCHEDULER_REFRESH_INTERVAL', '60')),
+    batch_size=results_batch_size,
+    flush_interval=float(os.environ.get('SCHEDULER_FLUSH_INTERVAL', '1')),
+    interval_policy=IntervalPolicy(
+        growth=float(os.environ.get('SCHEDULER_INTERVAL_GROWTH', '1.5')),
+        stable_checks=int(os.environ.get('SCHEDULER_STABLE_CHECKS', '3')),
+    ),
+)
+scheduler_enabled = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+event_hub = EventHub(max_queue=int(os.environ.get('EVENTS_QUEUE_SIZE', '100')))
+sse_ticket_ttl = float(os.environ.get('SSE_TICKET_TTL', '30'))
+incident_engine = IncidentEngine(
+    db_service,
+    confirm_failures=int(os.environ.get('INCIDENT_CONFIRM_FAILURES', '3')),
+    window=int(os.environ.get('INCIDENT_WINDOW', '5')),
+    recover_successes=int(os.environ.get('INCIDENT_RECOVER_SUCCESSES', '2')),
+    flap_window=float(os.environ.get('INCIDENT_FLAP_WINDOW', '300')),
+)
+loop_monitor = LoopLagMonitor(
+    interval=float(os.environ.get('LOOP_LAG_INTERVAL', '0.5')),
+    stall_threshold=float(os.environ.get('LOOP_STALL_THRESHOLD', '0.25')),
+)
+profile_lock = asyncio.Lock()
+# Обработчики сохраненных результатов (планировщик и ручные проверки)
+results_listeners = [incident_engine.process, event_hub.publish_check_results]
+scheduler.listeners.extend(results_listeners)
 
 # Create the main app without a prefix
 app = FastAPI(title="SiteGuard Pro+", version="1.0.0")
@@ -43,22 +116,41 @@ security = HTTPBearer()
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Получение текущего пользователя из JWT токена"""
-    token_data = auth_service.verify_token(credentials.credentials)
+    return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str) -> User:
+    """Проверка JWT токена и загрузка пользователя"""
+    token_data = auth_service.verify_token(token)
     if not token_data:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
     
+    # Пользователь берется из кэша DatabaseService, без запроса к базе на каждый вызов
     user = await db_service.get_user_by_id(token_data["user_id"])
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User is inactive"
+        )
     
     return user
 
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """Проверка прав администратора"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
 # Auth endpoints
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
@@ -79,7 +171,14 @@ async def register(user_data: UserCreate):
         )
     
     # Создаем пользователя
-    user = auth_service.create_user(user_data)
+    try:
+        user = await auth_service.create_user_async(user_data)
+    except AuthServiceBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry",
+            headers={"Retry-After": "1"}
+        )
     await db_service.create_user(user)
     
     # Создаем токен
@@ -90,7 +189,15 @@ async def register(user_data: UserCreate):
 async def login(user_data: UserLogin):
     """Вход пользователя"""
     user = await db_service.get_user_by_username(user_data.username)
-    if not user or not auth_service.verify_password(user_data.password, user.password_hash):
+    try:
+        password_ok = bool(user) and await auth_service.verify_password_async(user_data.password, user.password_hash)
+    except AuthServiceBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -105,14 +212,50 @@ async def validate_token(current_user: User = Depends(get_current_user)):
     return {"user_id": current_user.id, "username": current_user.username}
 
 # Sites endpoints
+def validate_check_interval(check_interval: int, interval_min: Optional[int], interval_max: Optional[int]):
+    """Границы адаптивного интервала должны включать check_interval"""
+    if (interval_min is not None and interval_min > check_interval) or \
+            (interval_max is not None and interval_max < check_interval):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="check_interval_min <= check_interval <= check_interval_max is required"
+        )
+
+# Поля SiteUpdate, которые можно опустить, но нельзя сбросить в null
+NON_NULLABLE_SITE_FIELDS = ("name", "url", "check_interval", "probe_mode", "keyword_is_regex")
+
+def validate_non_nullable(update_data: dict):
+    """Явный null в обязательном поле сохранился бы в Mongo и сломал бы Site(**doc)"""
+    nulls = [field for field in NON_NULLABLE_SITE_FIELDS if field in update_data and update_data[field] is None]
+    if nulls:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Fields cannot be null: {', '.join(nulls)}"
+        )
+
+def validate_probe_settings(probe_mode: ProbeMode, keyword: Optional[str], keyword_is_regex: bool):
+    """Для режима keyword нужно ключевое слово или корректное регулярное выражение"""
+    if probe_mode != ProbeMode.KEYWORD:
+        return
+    if not keyword:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="keyword is required for keyword probe mode"
+        )
+    try:
+        compile_keyword(keyword, keyword_is_regex)
+    except re.error as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid keyword pattern: {e}"
+        )
+
 @api_router.post("/add-site", response_model=Site)
 async def add_site(site_data: SiteCreate, current_user: User = Depends(get_current_user)):
     """Добавление нового сайта"""
-    site = Site(
-        name=site_data.name,
-        url=site_data.url,
-        owner_id=current_user.id
-    )
+    validate_check_interval(site_data.check_interval, site_data.check_interval_min, site_data.check_interval_max)
+    validate_probe_settings(site_data.probe_mode, site_data.keyword, site_data.keyword_is_regex)
+    site = Site(owner_id=current_user.id, **site_data.dict())
     
     created_site = await db_service.create_site(site)
     return created_site
@@ -145,6 +288,10 @@ async def update_site(site_id: str, site_data: SiteUpdate, current_user: User =
         )
     
     update_data = site_data.dict(exclude_unset=True)
+    validate_non_nullable(update_data)
+    merged = site.copy(update=update_data)
+    validate_check_interval(merged.check_interval, merged.check_interval_min, merged.check_interval_max)
+    validate_probe_settings(merged.probe_mode, merged.keyword, merged.keyword_is_regex)
     updated_site = await db_service.update_site(site_id, update_data)
     return updated_site
 
@@ -162,6 +309,17 @@ async def delete_site(site_id: str, current_user: User = Depends(get_current_use
     return {"message": "Site deleted successfully"}
 
 # Monitoring endpoints
+async def persist_check_results(items):
+    """Сохранение пачки ручных проверок и вызов обработчиков (как в CheckScheduler.flush)"""
+    if not items:
+        return
+    await db_service.record_check_results([result for _, result in items])
+    for listener in results_listeners:
+        try:
+            await listener(items)
+        except Exception:
+            logger.exception("Check results listener failed")
+
 @api_router.post("/check-sites")
 async def check_sites(current_user: User = Depends(get_current_user)):
     """Проверка всех сайтов пользователя"""
@@ -169,19 +327,17 @@ async def check_sites(current_user: User = Depends(get_current_user)):
     if not sites:
         return {"message": "No sites to check"}
     
-    # Проверяем все сайты
-    check_results = await monitoring_service.check_multiple_sites(sites)
-    
-    # Сохраняем результаты
-    for result in check_results:
-        await db_service.save_check_result(result)
-        
-        # Обновляем статус сайта
-        await db_service.update_site(result.site_id, {
-            "status": result.status,
-            "last_check": result.checked_at,
-            "response_time": result.response_time
-        })
+    # Проверяем все сайты и сохраняем результаты пачками по мере готовности
+    sites_by_id = {site.id: site for site in sites}
+    check_results = []
+    batch = []
+    async for result in monitoring_service.iter_check_results(sites):
+        check_results.append(result)
+        batch.append(result)
+        if len(batch) >= results_batch_size:
+            await persist_check_results([(sites_by_id[r.site_id], r) for r in batch])
+            batch = []
+    await persist_check_results([(sites_by_id[r.site_id], r) for r in batch])
     
     return {"message": f"Checked {len(check_results)} sites", "results": check_results}
 
@@ -198,6 +354,94 @@ async def get_site_stats(site_id: str, current_user: User = Depends(get_current_
     stats = await db_service.get_site_stats(site_id)
     return stats
 
+@api_router.get("/stats/{site_id}/percentiles", response_model=LatencyPercentiles)
+async def get_latency_percentiles(
+    site_id: str,
+    hours: int = Query(24, ge=1, le=24 * 366),
+    current_user: User = Depends(get_current_user)
+):
+    """Перцентили времени ответа (p50/p95/p99) за последние hours часов"""
+    site = await db_service.get_site(site_id)
+    if not site or site.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Site not found"
+        )
+    
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return await db_service.get_latency_percentiles(site_id, since)
+
+@api_router.get("/stats/{site_id}/reliability", response_model=ReliabilityReport)
+async def get_reliability_report(
+    site_id: str,
+    days: int = Query(30, ge=1, le=366),
+    current_user: User = Depends(get_current_user)
+):
+    """MTTR, MTBF и время простоя за последние days дней (по инцидентам)"""
+    site = await db_service.get_site(site_id)
+    if not site or site.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Site not found"
+        )
+
+    since = datetime.utcnow() - timedelta(days=days)
+    return await db_service.get_reliability_report(site_id, since)
+
+@api_router.get("/incidents", response_model=List[Incident])
+async def get_incidents(
+    open_only: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user)
+):
+    """Последние инциденты по всем сайтам пользователя"""
+    return await db_service.get_incidents(owner_id=current_user.id, open_only=open_only, limit=limit)
+
+@api_router.get("/sites/{site_id}/incidents", response_model=List[Incident])
+async def get_site_incidents(
+    site_id: str,
+    open_only: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user)
+):
+    """Инциденты сайта, новые первыми"""
+    site = await db_service.get_site(site_id)
+    if not site or site.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Site not found"
+        )
+
+    return await db_service.get_incidents(site_id=site_id, open_only=open_only, limit=limit)
+
+@api_router.get("/stats/{site_id}/analytics")
+async def get_site_analytics(
+    site_id: str,
+    days: int = Query(30, ge=1, le=366),
+    granularity_minutes: int = Query(60, ge=1, le=7 * 24 * 60),
+    current_user: User = Depends(get_current_user)
+):
+    """Uptime, тренд с заданной гранулярностью и интервалы недоступности по сырой истории"""
+    site = await db_service.get_site(site_id)
+    if not site or site.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Site not found"
+        )
+    
+    since = datetime.utcnow() - timedelta(days=days)
+    series = await db_service.load_check_series(site_id, since)
+    return {
+        "site_id": site_id,
+        "total_checks": len(series),
+        "uptime_percentage": series.uptime_percentage(),
+        "average_response_time": series.average_response_time(),
+        "trend": series.trend(timedelta(minutes=granularity_minutes), start=since),
+        "downtime_intervals": [
+            {"start": start, "end": end} for start, end in series.downtime_intervals()
+        ]
+    }
+
 @api_router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     """Получение статистики для дашборда"""
@@ -217,6 +461,164 @@ async def get_site_checks(site_id: str, limit: int = 100, current_user: User = D
     checks = await db_service.get_site_checks(site_id, limit)
     return checks
 
+@api_router.get("/sites/{site_id}/checks/page", response_model=CheckHistoryPage)
+async def get_site_checks_page(
+    site_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Постраничная история проверок сайта (курсоры before/after)"""
+    site = await db_service.get_site(site_id)
+    if not site or site.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Site not found"
+        )
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either 'before' or 'after', not both"
+        )
+    
+    try:
+        return await db_service.get_site_checks_page(site_id, limit, before, after, since, until)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+@api_router.get("/sites/{site_id}/checks/export")
+async def export_site_checks(
+    site_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Экспорт истории проверок в формате NDJSON (потоково)"""
+    site = await db_service.get_site(site_id)
+    if not site or site.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Site not found"
+        )
+    
+    async def generate():
+        async for check_data in db_service.iter_site_checks(site_id, since, until):
+            yield json.dumps(check_data, default=_json_default) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# Live updates
+optional_security = HTTPBearer(auto_error=False)
+
+@api_router.post("/events/ticket")
+async def create_events_ticket(current_user: User = Depends(get_current_user)):
+    """Одноразовый билет для подключения к /events из EventSource"""
+    ticket = await db_service.create_sse_ticket(current_user.id, sse_ticket_ttl)
+    return {"ticket": ticket, "expires_in": sse_ticket_ttl}
+
+@api_router.get("/events")
+async def stream_events(
+    request: Request,
+    ticket: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Server-Sent Events: новые результаты проверок и смены статусов сайтов пользователя.
+
+    EventSource в браузере не умеет задавать заголовки, поэтому вместо JWT
+    в URL (он попал бы в access-логи) передается билет из POST /events/ticket:
+    одноразовый и живущий SSE_TICKET_TTL секунд.
+    """
+    if credentials:
+        current_user = await authenticate_token(credentials.credentials)
+    elif ticket:
+        user_id = await db_service.redeem_sse_ticket(ticket)
+        user = await db_service.get_user_by_id(user_id) if user_id else None
+        if not user or not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired ticket"
+            )
+        current_user = user
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    async def generate():
+        subscription = event_hub.subscribe(current_user.id)
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=15)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                data = json.dumps(event["data"], default=_json_default)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Admin endpoints
+@api_router.get("/admin/index-stats")
+async def get_index_stats(current_user: User = Depends(get_current_admin)):
+    """Статистика использования индексов MongoDB"""
+    return await db_service.get_index_stats()
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: User = Depends(get_current_admin)):
+    """Размер и счетчики попаданий/промахов кэшей"""
+    return {**db_service.cache_stats(), "tokens": auth_service.token_cache.stats()}
+
+@api_router.get("/admin/loop-lag")
+async def get_loop_lag(current_user: User = Depends(get_current_admin)):
+    """Задержка event loop и число зафиксированных блокировок"""
+    return loop_monitor.stats()
+
+@api_router.get("/admin/profile", response_class=PlainTextResponse)
+async def profile_process(
+    seconds: float = Query(5.0, gt=0, le=60),
+    interval_ms: float = Query(5.0, ge=1, le=100),
+    all_threads: bool = False,
+    current_user: User = Depends(get_current_admin)
+):
+    """Сэмплирующий профиль живого процесса в формате folded stacks (для flamegraph)"""
+    if profile_lock.locked():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Profiling is already in progress"
+        )
+    async with profile_lock:
+        # Сэмплер работает в отдельном потоке и снимает стек потока event loop
+        thread_id = None if all_threads else threading.get_ident()
+        folded = await asyncio.get_running_loop().run_in_executor(
+            None, sample_stacks, seconds, interval_ms / 1000, thread_id
+        )
+    return PlainTextResponse(folded)
+
+@api_router.post("/admin/rebuild-rollups")
+async def rebuild_rollups(current_user: User = Depends(get_current_admin)):
+    """Пересчет закрытых часовых и суточных корзин из сырых проверок"""
+    await db_service.rebuild_rollups()
+    return {"message": "Rollups rebuilt"}
+
 # Legacy endpoints for compatibility
 @api_router.get("/")
 async def root():
@@ -234,8 +636,14 @@ async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики в формате Prometheus"""
+    return Response(content=metrics.generate_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 # Include the router in the main app
 app.include_router(api_router)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -252,6 +660,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_services():
+    try:
+        await db_service.ensure_indexes()
+    except Exception as e:
+        logger.error("Index bootstrap failed: %s", e)
+    try:
+        if await db_service.backfill_rollups():
+            logger.info("Rollups backfilled from raw checks")
+    except Exception as e:
+        logger.error("Rollup backfill failed: %s", e)
+    await loop_monitor.start()
+    await monitoring_service.start()
+    if scheduler_enabled:
+        await scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_services():
+    await scheduler.stop()
+    await monitoring_service.close()
+    auth_service.close()
+    await loop_monitor.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
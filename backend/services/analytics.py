@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from models import SiteStatus
+
+_ONLINE = SiteStatus.ONLINE.value
+
+
+class CheckSeries:
+    """Колоночное представление истории проверок для векторных расчетов.
+
+    timestamps - datetime64[ms] по возрастанию, online - bool,
+    status_codes - int32 (-1, если кода нет), latency - float64 (NaN, если нет).
+    """
+
+    def __init__(self, timestamps: np.ndarray, online: np.ndarray, status_codes: np.ndarray, latency: np.ndarray):
+        order = np.argsort(timestamps, kind="stable")
+        self.timestamps = timestamps[order]
+        self.online = online[order]
+        self.status_codes = status_codes[order]
+        self.latency = latency[order]
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]]) -> "CheckSeries":
+        """Сборка из документов MongoDB (checked_at, status, status_code, response_time)"""
+        timestamps: List[datetime] = []
+        online: List[bool] = []
+        status_codes: List[int] = []
+        latency: List[float] = []
+        for document in documents:
+            timestamps.append(document["checked_at"])
+            online.append(document["status"] == _ONLINE)
+            status_code = document.get("status_code")
+            status_codes.append(-1 if status_code is None else status_code)
+            response_time = document.get("response_time")
+            latency.append(np.nan if response_time is None else response_time)
+        return cls(
+            np.array(timestamps, dtype="datetime64[ms]"),
+            np.array(online, dtype=bool),
+            np.array(status_codes, dtype=np.int32),
+            np.array(latency, dtype=np.float64),
+        )
+
+    @classmethod
+    def from_column_chunks(cls, chunks: Iterable[Dict[str, List[Any]]]) -> "CheckSeries":
+        """Сборка из колонок, собранных на стороне MongoDB ($group + $push, см. load_check_series).
+
+        Фрагмент - dict со списками epoch_ms, online, status_code, response_time
+        (None - нет значения); массивы строятся целиком, без обхода строк в Python.
+        """
+        chunks = list(chunks)
+
+        def column(name: str, dtype) -> np.ndarray:
+            if not chunks:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate([np.array(chunk[name], dtype=dtype) for chunk in chunks])
+
+        return cls(
+            column("epoch_ms", np.int64).astype("datetime64[ms]"),
+            column("online", bool),
+            column("status_code", np.int32),
+            column("response_time", np.float64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def uptime_percentage(self) -> float:
+        """Процент успешных проверок"""
+        if not len(self):
+            return 0.0
+        return float(np.count_nonzero(self.online)) / len(self) * 100
+
+    def average_response_time(self) -> float:
+        """Среднее время ответа без учета пропусков"""
+        valid = ~np.isnan(self.latency)
+        if not valid.any():
+            return 0.0
+        return float(self.latency[valid].mean())
+
+    def rolling_uptime(self, window: int) -> np.ndarray:
+        """Uptime (%) по скользящему окну из window последних проверок"""
+        if window <= 0 or len(self) < window:
+            return np.empty(0)
+        cumulative = np.concatenate(([0], np.cumsum(self.online, dtype=np.int64)))
+        return (cumulative[window:] - cumulative[:-window]) / window * 100
+
+    def moving_average_latency(self, window: int) -> np.ndarray:
+        """Скользящее среднее времени ответа по window проверкам (пропуски не учитываются)"""
+        if window <= 0 or len(self) < window:
+            return np.empty(0)
+        valid = ~np.isnan(self.latency)
+        values = np.where(valid, self.latency, 0.0)
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        counts = np.concatenate(([0], np.cumsum(valid, dtype=np.int64)))
+        window_sums = sums[window:] - sums[:-window]
+        window_counts = counts[window:] - counts[:-window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+    def downtime_intervals(self) -> List[Tuple[datetime, datetime]]:
+        """Интервалы недоступности: от первой неуспешной проверки до следующей успешной"""
+        if not len(self):
+            return []
+        down = (~self.online).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], down, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)  # индекс первой успешной проверки после сбоя
+        # Незакрытый сбой заканчивается на последней проверке ряда
+        ends = np.minimum(ends, len(self) - 1)
+        start_times = self.timestamps[starts].astype(datetime).tolist()
+        end_times = self.timestamps[ends].astype(datetime).tolist()
+        return list(zip(start_times, end_times))
+
+    def trend(self, granularity: timedelta, start: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Uptime и среднее время ответа по интервалам произвольной длины"""
+        if not len(self):
+            return []
+        step = np.timedelta64(int(granularity.total_seconds() * 1000), "ms")
+        origin = np.datetime64(start, "ms") if start else self.timestamps[0]
+        mask = self.timestamps >= origin
+        indexes = ((self.timestamps[mask] - origin) // step).astype(np.int64)
+        if not len(indexes):
+            return []
+        size = int(indexes[-1]) + 1
+        totals = np.bincount(indexes, minlength=size)
+        online = np.bincount(indexes, weights=self.online[mask], minlength=size)
+        latency = self.latency[mask]
+        valid = ~np.isnan(latency)
+        latency_sums = np.bincount(indexes[valid], weights=latency[valid], minlength=size)
+        latency_counts = np.bincount(indexes[valid], minlength=size)
+
+        trend = []
+        for i in np.flatnonzero(totals):
+            trend.append({
+                "start": (origin + i * step).astype(datetime),
+                "total": int(totals[i]),
+                "uptime": float(online[i] / totals[i] * 100),
+                "average_response_time": float(latency_sums[i] / latency_counts[i]) if latency_counts[i] else None,
+            })
+        return trend
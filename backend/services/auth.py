@@ -1,14 +1,35 @@
 import jwt
 import bcrypt
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from models import User, UserCreate, UserLogin, Token
+from services.cache import TTLCache
+
+class AuthServiceBusy(Exception):
+    """Очередь операций хеширования паролей переполнена"""
 
 class AuthService:
-    def __init__(self, secret_key: str = "your-secret-key-here"):
+    def __init__(
+        self,
+        secret_key: str = "your-secret-key-here",
+        token_cache_size: int = 10000,
+        token_cache_ttl: float = 300.0,
+        hash_workers: int = 4,
+        max_pending_hashes: int = 64,
+    ):
         self.secret_key = secret_key
         self.algorithm = "HS256"
         self.access_token_expire_minutes = 30 * 24 * 60  # 30 дней
+        # Кэш декодированных токенов: sha256(token) -> payload
+        self.token_cache = TTLCache(maxsize=token_cache_size, ttl=token_cache_ttl)
+        # bcrypt выполняется в отдельном пуле потоков, чтобы не блокировать event loop
+        self.max_pending_hashes = max_pending_hashes
+        self._hash_executor = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix="bcrypt")
+        self._pending_hashes = 0
     
     def hash_password(self, password: str) -> str:
         """Хеширование пароля"""
@@ -19,6 +40,29 @@ class AuthService:
         """Проверка пароля"""
         return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
     
+    async def _run_hash(self, func, *args):
+        """Запуск bcrypt в пуле с ограничением длины очереди"""
+        if self._pending_hashes >= self.max_pending_hashes:
+            raise AuthServiceBusy("Too many pending password operations")
+        self._pending_hashes += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._hash_executor, func, *args)
+        finally:
+            self._pending_hashes -= 1
+    
+    async def hash_password_async(self, password: str) -> str:
+        """Хеширование пароля в пуле потоков"""
+        return await self._run_hash(self.hash_password, password)
+    
+    async def verify_password_async(self, password: str, hashed_password: str) -> bool:
+        """Проверка пароля в пуле потоков"""
+        return await self._run_hash(self.verify_password, password, hashed_password)
+    
+    def close(self):
+        """Остановка пула хеширования"""
+        self._hash_executor.shutdown(wait=False, cancel_futures=True)
+    
     def create_access_token(self, user_id: str, username: str) -> str:
         """Создание JWT токена"""
         expire = datetime.utcnow() + timedelta(minutes=self.access_token_expire_minutes)
@@ -32,11 +76,20 @@ class AuthService:
     
     def verify_token(self, token: str) -> Optional[dict]:
         """Проверка JWT токена"""
+        token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        payload = self.token_cache.get(token_hash)
+        if payload is not None:
+            return payload
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
         except jwt.PyJWTError:
             return None
+        # Запись в кэше не должна пережить срок действия токена
+        ttl = self.token_cache.ttl
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - time.time())
+        self.token_cache.set(token_hash, payload, ttl=ttl)
+        return payload
     
     def create_user(self, user_data: UserCreate) -> User:
         """Создание нового пользователя"""
@@ -48,4 +101,14 @@ class AuthService:
             password_hash=hashed_password
         )
         
-        return user
\ No newline at end of file
+        return user
+    
+    async def create_user_async(self, user_data: UserCreate) -> User:
+        """Создание нового пользователя (хеширование в пуле потоков)"""
+        hashed_password = await self.hash_password_async(user_data.password)
+        
+        return User(
+            email=user_data.email,
+            username=user_data.username,
+            password_hash=hashed_password
+        )
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Замер задержки планирования event loop и поиск блокирующих вызовов.
+
+    Задача в цикле засыпает на interval и измеряет, насколько позже она
+    проснулась. Отдельный поток-сторож следит за отметкой этой задачи:
+    если цикл не отвечает дольше stall_threshold, в лог пишется стек
+    потока цикла - то есть код, который его сейчас блокирует.
+    """
+
+    def __init__(self, interval: float = 0.5, stall_threshold: float = 0.25, history_size: int = 120):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags: Deque[float] = deque(maxlen=history_size)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._reported_heartbeat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._watchdog = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._heartbeat = time.monotonic()
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            metrics.observe_loop_lag(lag)
+
+    def _watch(self):
+        # Проверяем чаще порога, чтобы застать блокирующий код на месте
+        period = min(self.stall_threshold / 2, self.interval)
+        while not self._stopped.wait(period):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            if stalled_for < self.stall_threshold or heartbeat == self._reported_heartbeat:
+                continue
+            self._reported_heartbeat = heartbeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+            logger.warning("Event loop blocked for %.3fs, current stack:\n%s", stalled_for, stack)
+
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        return {
+            "interval": self.interval,
+            "last_lag": self.lags[-1] if self.lags else None,
+            "mean_lag": sum(lags) / len(lags) if lags else None,
+            "p99_lag": lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else None,
+            "max_lag": self.max_lag,
+            "stalls": self.stalls,
+        }
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _folded_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(duration: float, interval: float = 0.005, thread_id: Optional[int] = None) -> str:
+    """Сэмплирующий профиль стеков в формате folded (flamegraph.pl, speedscope).
+
+    Выполняется в отдельном потоке, поэтому снимки продолжаются, даже если
+    event loop заблокирован. thread_id=None - все потоки, кроме самого профайлера.
+    """
+    own_id = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for frame_thread_id, frame in sys._current_frames().items():
+            if frame_thread_id == own_id or (thread_id is not None and frame_thread_id != thread_id):
+                continue
+            counts[_folded_stack(frame)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from models import Site, CheckResult
+
+
+class Subscription:
+    """Подписка одного подключения с ограниченной очередью событий"""
+
+    def __init__(self, hub: "EventHub", owner_id: str, max_queue: int):
+        self.hub = hub
+        self.owner_id = owner_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, event: Dict[str, Any]):
+        """Постановка события; медленный клиент теряет самые старые события"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Следующее событие или None по таймауту"""
+        if self.dropped:
+            # Клиент пропустил события - просим его перечитать состояние
+            dropped, self.dropped = self.dropped, 0
+            return {"type": "resync", "data": {"dropped": dropped}}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """In-process pub/sub: рассылка событий подключениям владельца сайтов"""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def subscribe(self, owner_id: str) -> Subscription:
+        subscription = Subscription(self, owner_id, self.max_queue)
+        self._subscribers.setdefault(owner_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscribers.get(subscription.owner_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[subscription.owner_id]
+
+    def publish(self, owner_id: str, event: Dict[str, Any]) -> int:
+        """Рассылка события всем подключениям пользователя"""
+        subscriptions = self._subscribers.get(owner_id)
+        if not subscriptions:
+            return 0
+        for subscription in subscriptions:
+            subscription.put(event)
+        return len(subscriptions)
+
+    async def publish_check_results(self, items: List[Tuple[Site, CheckResult]]):
+        """События о новых результатах и смене статуса (site - состояние до проверки)"""
+        for site, result in items:
+            if site.owner_id not in self._subscribers:
+                continue
+            self.publish(site.owner_id, {"type": "check_result", "data": result.dict()})
+            if site.status != result.status:
+                self.publish(site.owner_id, {"type": "status_change", "data": {
+                    "site_id": site.id,
+                    "previous_status": site.status,
+                    "status": result.status,
+                    "changed_at": result.checked_at
+                }})
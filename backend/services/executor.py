@@ -0,0 +1,103 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+from models import Site, CheckResult
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket)"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _HostLimiter:
+    def __init__(self, concurrency: int, rate: Optional[float]):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.users = 0
+
+
+class ProbeExecutor:
+    """Исполнитель проверок с глобальным и per-host ограничением параллелизма"""
+
+    def __init__(
+        self,
+        probe: Callable[[Site], Awaitable[CheckResult]],
+        max_concurrency: int = 200,
+        per_host_concurrency: int = 4,
+        per_host_rate: Optional[float] = None,
+    ):
+        self._probe = probe
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate  # запусков проверки в секунду на хост
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts: Dict[str, _HostLimiter] = {}
+        self.queued = 0
+        self.in_flight = 0
+
+    async def run(self, site: Site) -> CheckResult:
+        """Выполнение одной проверки с учетом лимитов"""
+        host = (urlparse(str(site.url)).hostname or "").lower()
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = _HostLimiter(self.per_host_concurrency, self.per_host_rate)
+        limiter.users += 1
+        self.queued += 1
+        started = False
+        try:
+            # Сначала ждем слот хоста, чтобы не занимать глобальный слот впустую
+            async with limiter.semaphore:
+                if limiter.bucket:
+                    await limiter.bucket.acquire()
+                async with self._global:
+                    self.queued -= 1
+                    started = True
+                    self.in_flight += 1
+                    try:
+                        return await self._probe(site)
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            if not started:
+                self.queued -= 1
+            limiter.users -= 1
+            # Лимитер с token bucket оставляем, иначе потеряется история запросов к хосту
+            if limiter.users == 0 and limiter.bucket is None:
+                self._hosts.pop(host, None)
+
+    async def map(self, sites: Iterable[Site]) -> AsyncIterator[CheckResult]:
+        """Проверка набора сайтов; результаты отдаются по мере готовности"""
+        tasks = [asyncio.ensure_future(self.run(site)) for site in sites]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    continue
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from models import Site, CheckResult, SiteStatus, Incident
+
+logger = logging.getLogger(__name__)
+
+# Статусы, считающиеся сбоем; UNKNOWN (ошибка самой проверки) не учитывается
+FAILURE_STATUSES = (SiteStatus.OFFLINE, SiteStatus.WARNING)
+
+
+class _SiteState:
+    __slots__ = ("recent", "incident", "last_resolved", "successes", "recovered_at")
+
+    def __init__(self, window: int, incident: Optional[Incident] = None):
+        self.recent: Deque[CheckResult] = deque(maxlen=window)
+        self.incident = incident
+        self.last_resolved: Optional[Incident] = None
+        self.successes = 0
+        self.recovered_at: Optional[datetime] = None
+
+
+class IncidentChange:
+    """Изменение инцидента за одну пачку в виде приращений.
+
+    base_resolved_at - состояние, от которого посчитаны приращения: в базе
+    изменение применяется, только если инцидент все еще в этом состоянии.
+    """
+    __slots__ = ("incident", "is_new", "base_resolved_at", "failed_checks", "flap_count")
+
+    def __init__(self, incident: Incident, is_new: bool = False):
+        self.incident = incident
+        self.is_new = is_new
+        self.base_resolved_at = incident.resolved_at
+        self.failed_checks = 0
+        self.flap_count = 0
+
+
+class IncidentEngine:
+    """Инкрементальное отслеживание инцидентов по мере поступления результатов.
+
+    Инцидент открывается, когда confirm_failures из последних window проверок
+    неуспешны, и закрывается после recover_successes успешных проверок подряд.
+    Если сбой повторяется в течение flap_window секунд после закрытия,
+    переоткрывается прежний инцидент вместо создания нового.
+    """
+
+    def __init__(
+        self,
+        db_service,
+        confirm_failures: int = 3,
+        window: int = 5,
+        recover_successes: int = 2,
+        flap_window: float = 300.0,
+    ):
+        if not 1 <= confirm_failures <= window:
+            raise ValueError("confirm_failures must be between 1 and window")
+        self.db_service = db_service
+        self.confirm_failures = confirm_failures
+        self.window = window
+        self.recover_successes = max(1, recover_successes)
+        self.flap_window = flap_window
+        self._states: Dict[str, _SiteState] = {}
+        self._lock = asyncio.Lock()
+
+    async def process(self, items: List[Tuple[Site, CheckResult]]) -> List[Incident]:
+        """Обработка пачки результатов; возвращает измененные инциденты"""
+        async with self._lock:
+            await self._load_states({site.id for site, _ in items} - self._states.keys())
+            changes: Dict[str, IncidentChange] = {}
+            for site, result in sorted(items, key=lambda item: item[1].checked_at):
+                self._apply(site, result, changes)
+            if not changes:
+                return []
+            stale = set(await self.db_service.save_incidents(list(changes.values())))
+            for incident_id in stale:
+                # Инцидент уже изменен другим процессом - состояние сайта перечитается из базы
+                site_id = changes[incident_id].incident.site_id
+                self._states.pop(site_id, None)
+                logger.info("Incident %s changed elsewhere, reloading state for site %s", incident_id, site_id)
+            return [change.incident for incident_id, change in changes.items() if incident_id not in stale]
+
+    async def _load_states(self, site_ids):
+        """Открытые инциденты сайтов, впервые увиденных этим процессом"""
+        if not site_ids:
+            return
+        open_incidents = await self.db_service.get_open_incidents(list(site_ids))
+        for site_id in site_ids:
+            self._states[site_id] = _SiteState(self.window, open_incidents.get(site_id))
+
+    @staticmethod
+    def _change(changes: Dict[str, IncidentChange], incident: Incident, is_new: bool = False) -> IncidentChange:
+        """Запись изменений инцидента в пачке; создается до изменения resolved_at"""
+        change = changes.get(incident.id)
+        if change is None:
+            change = changes[incident.id] = IncidentChange(incident, is_new)
+        return change
+
+    def _apply(self, site: Site, result: CheckResult, changes: Dict[str, IncidentChange]) -> Optional[Incident]:
+        if result.status == SiteStatus.UNKNOWN:
+            return None
+        state = self._states.setdefault(site.id, _SiteState(self.window))
+        failed = result.status in FAILURE_STATUSES
+        state.recent.append(result)
+
+        incident = state.incident
+        if incident is None:
+            failures = [check for check in state.recent if check.status in FAILURE_STATUSES]
+            if not failed or len(failures) < self.confirm_failures:
+                return None
+            incident = self._open(site, state, failures, result, changes)
+        elif failed:
+            state.successes = 0
+            state.recovered_at = None
+            incident.failed_checks += 1
+            self._change(changes, incident).failed_checks += 1
+            if result.status == SiteStatus.OFFLINE:
+                incident.status = SiteStatus.OFFLINE
+            incident.error_message = result.error_message or incident.error_message
+        else:
+            state.successes += 1
+            if state.recovered_at is None:
+                state.recovered_at = result.checked_at
+            if state.successes >= self.recover_successes:
+                self._change(changes, incident)
+                incident.resolved_at = state.recovered_at
+                state.last_resolved = incident
+                state.incident = None
+                state.recent.clear()
+                state.successes = 0
+                state.recovered_at = None
+                logger.info("Incident %s resolved for site %s", incident.id, site.id)
+        incident.last_check_at = result.checked_at
+        self._change(changes, incident)
+        return incident
+
+    def _open(
+        self,
+        site: Site,
+        state: _SiteState,
+        failures: List[CheckResult],
+        result: CheckResult,
+        changes: Dict[str, IncidentChange],
+    ) -> Incident:
+        previous = state.last_resolved
+        started_at = failures[0].checked_at
+        if previous is not None and (started_at - previous.resolved_at).total_seconds() <= self.flap_window:
+            # Сайт «мигает» - продолжаем прежний инцидент
+            incident = previous
+            change = self._change(changes, incident)
+            incident.resolved_at = None
+            incident.flap_count += 1
+            incident.failed_checks += len(failures)
+            change.flap_count += 1
+            change.failed_checks += len(failures)
+        else:
+            incident = Incident(
+                site_id=site.id,
+                owner_id=site.owner_id,
+                status=result.status,
+                started_at=started_at,
+                confirmed_at=result.checked_at,
+                last_check_at=result.checked_at,
+                failed_checks=len(failures),
+            )
+            self._change(changes, incident, is_new=True).failed_checks = len(failures)
+        if any(check.status == SiteStatus.OFFLINE for check in failures):
+            incident.status = SiteStatus.OFFLINE
+        incident.error_message = result.error_message or incident.error_message
+        state.incident = incident
+        state.last_resolved = None
+        state.successes = 0
+        state.recovered_at = None
+        logger.info("Incident %s opened for site %s", incident.id, site.id)
+        return incident
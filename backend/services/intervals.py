@@ -0,0 +1,54 @@
+from typing import Optional, Tuple
+
+from models import Site, SiteStatus
+
+
+class SiteHealth:
+    """Серии последних результатов сайта для выбора интервала"""
+
+    __slots__ = ("successes", "failures")
+
+    def __init__(self):
+        self.successes = 0  # подряд успешных проверок
+        self.failures = 0  # подряд неуспешных проверок
+
+    def record(self, status: SiteStatus):
+        if status == SiteStatus.ONLINE:
+            self.successes += 1
+            self.failures = 0
+        else:
+            self.failures += 1
+            self.successes = 0
+
+
+class IntervalPolicy:
+    """Адаптивный интервал проверки в границах check_interval_min/max сайта.
+
+    Неуспешная проверка и первые stable_checks успешных после нее идут
+    с минимальным интервалом: сбой быстро подтверждается, восстановление
+    быстро обнаруживается, а «мигающий» сайт не успевает уйти на редкие
+    проверки. Дальше интервал растет от check_interval в growth раз
+    на каждую успешную проверку, но не выше максимума.
+    """
+
+    def __init__(self, growth: float = 1.5, stable_checks: int = 3):
+        self.growth = growth
+        self.stable_checks = stable_checks
+
+    @staticmethod
+    def bounds(site: Site) -> Tuple[int, int]:
+        """Границы интервала; без настроек сайт проверяется с check_interval"""
+        lower = min(site.check_interval_min or site.check_interval, site.check_interval)
+        upper = max(site.check_interval_max or site.check_interval, site.check_interval)
+        return lower, upper
+
+    def interval(self, site: Site, health: Optional[SiteHealth]) -> float:
+        lower, upper = self.bounds(site)
+        if health is None or lower == upper:
+            return float(site.check_interval)
+        if health.failures or health.successes < self.stable_checks:
+            return float(lower)
+        steps = health.successes - self.stable_checks
+        # Ограничение степени, чтобы не переполнить float на длинных сериях
+        interval = site.check_interval * self.growth ** min(steps, 64)
+        return float(min(interval, upper))
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import math
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from models import Site
+
+logger = logging.getLogger(__name__)
+
+# Обработчик смены набора партиций воркера
+LeasesListener = Callable[[Set[int]], None]
+
+# Значение expires_at для свободной партиции
+_RELEASED = datetime(1970, 1, 1)
+
+
+def site_partition(site_id: str, partitions: int) -> int:
+    """Номер партиции сайта (стабильный хэш, одинаковый во всех процессах)"""
+    return zlib.crc32(site_id.encode("utf-8")) % partitions
+
+
+class LeaseManager:
+    """Распределение сайтов между воркерами через аренду партиций в MongoDB.
+
+    Сайты делятся на partitions партиций по хэшу id. Воркер держит аренду
+    (lease) своих партиций и продлевает ее каждые renew_interval секунд;
+    аренда умершего воркера истекает через lease_ttl, и партиции забирают
+    остальные. Каждый воркер стремится к равной доле партиций, поэтому при
+    появлении нового воркера лишние партиции освобождаются.
+    """
+
+    def __init__(
+        self,
+        db,
+        worker_id: str,
+        partitions: int = 64,
+        lease_ttl: float = 30.0,
+        renew_interval: float = 10.0,
+    ):
+        if renew_interval >= lease_ttl:
+            raise ValueError("renew_interval must be less than lease_ttl")
+        self.leases_collection = db.probe_leases
+        self.workers_collection = db.probe_workers
+        self.worker_id = worker_id
+        self.partitions = partitions
+        self.lease_ttl = lease_ttl
+        self.renew_interval = renew_interval
+        self.owned: Set[int] = set()
+        self.listeners: List[LeasesListener] = []
+        # Время (loop.time()), до которого аренда гарантированно наша
+        self._valid_until = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        await self.leases_collection.create_indexes([IndexModel([("owner", ASCENDING)])])
+        # Записи о давно пропавших воркерах удаляются через сутки
+        await self.workers_collection.create_indexes([
+            IndexModel([("heartbeat_at", ASCENDING)], expireAfterSeconds=86400)
+        ])
+        # Партиции, оставшиеся от большего WORKER_PARTITIONS: на них не попадает ни один сайт
+        await self.leases_collection.delete_many({"_id": {"$gte": self.partitions}})
+        # Документы всех партиций создаются заранее - захват идет без upsert
+        await self.leases_collection.bulk_write([
+            UpdateOne(
+                {"_id": partition},
+                {"$setOnInsert": {"owner": None, "expires_at": _RELEASED}},
+                upsert=True,
+            )
+            for partition in range(self.partitions)
+        ], ordered=False)
+
+    def owns(self, site: Site) -> bool:
+        """Проверяет ли этот воркер сайт (только пока аренда не истекла)"""
+        if asyncio.get_running_loop().time() >= self._valid_until:
+            return False
+        return site_partition(site.id, self.partitions) in self.owned
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        await self.ensure_indexes()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Lease manager started for worker %s", self.worker_id)
+
+    async def stop(self):
+        """Остановка с освобождением аренды, чтобы партиции сразу забрали другие"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.leases_collection.update_many(
+                {"owner": self.worker_id},
+                {"$set": {"owner": None, "expires_at": _RELEASED}},
+            )
+            await self.workers_collection.delete_one({"_id": self.worker_id})
+        except Exception:
+            logger.exception("Failed to release leases of worker %s", self.worker_id)
+        self._set_owned(set())
+        logger.info("Lease manager stopped for worker %s", self.worker_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.renew()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lease renewal failed for worker %s", self.worker_id)
+            await asyncio.sleep(self.renew_interval)
+
+    async def renew(self) -> Set[int]:
+        """Один цикл: heartbeat, продление, освобождение лишнего и захват свободного"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_ttl)
+
+        await self.workers_collection.update_one(
+            {"_id": self.worker_id}, {"$set": {"heartbeat_at": now}}, upsert=True
+        )
+        alive = await self.workers_collection.count_documents({
+            "heartbeat_at": {"$gt": now - timedelta(seconds=self.lease_ttl)}
+        })
+        share = math.ceil(self.partitions / max(alive, 1))
+
+        # Только партиции текущей схемы, даже если в коллекции остались лишние
+        partitions = {"$lt": self.partitions}
+        await self.leases_collection.update_many(
+            {"_id": partitions, "owner": self.worker_id, "expires_at": {"$gt": now}},
+            {"$set": {"expires_at": expires_at}},
+        )
+        owned = {
+            doc["_id"] async for doc in self.leases_collection.find(
+                {"_id": partitions, "owner": self.worker_id, "expires_at": {"$gt": now}}, {"_id": 1}
+            )
+        }
+
+        if len(owned) > share:
+            excess = sorted(owned)[share:]
+            await self.leases_collection.update_many(
+                {"_id": {"$in": excess}, "owner": self.worker_id},
+                {"$set": {"owner": None, "expires_at": _RELEASED}},
+            )
+            owned.difference_update(excess)
+        elif len(owned) < share:
+            free = [
+                doc["_id"] async for doc in self.leases_collection.find(
+                    {"_id": partitions, "expires_at": {"$lte": now}}, {"_id": 1}
+                ).limit(share - len(owned))
+            ]
+            for partition in free:
+                # Условие на expires_at защищает от одновременного захвата
+                result = await self.leases_collection.update_one(
+                    {"_id": partition, "expires_at": {"$lte": now}},
+                    {"$set": {"owner": self.worker_id, "expires_at": expires_at}},
+                )
+                if result.modified_count:
+                    owned.add(partition)
+
+        # Запас на задержку цикла: считаем аренду действующей чуть меньше lease_ttl
+        self._valid_until = started + self.lease_ttl - self.renew_interval / 2
+        self._set_owned(owned)
+        return owned
+
+    def _set_owned(self, owned: Set[int]):
+        if owned == self.owned:
+            return
+        gained = len(owned - self.owned)
+        lost = len(self.owned - owned)
+        self.owned = owned
+        logger.info(
+            "Worker %s owns %d/%d partitions (+%d/-%d)",
+            self.worker_id, len(owned), self.partitions, gained, lost
+        )
+        for listener in self.listeners:
+            try:
+                listener(set(owned))
+            except Exception:
+                logger.exception("Leases listener failed")
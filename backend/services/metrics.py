@@ -0,0 +1,109 @@
+import inspect
+import time
+from functools import wraps
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest, start_http_server
+
+PROBE_DURATION = Histogram(
+    "siteguard_probe_duration_seconds",
+    "Duration of MonitoringService.check_site by resulting site status",
+    ["status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_CALL_DURATION = Histogram(
+    "siteguard_db_call_duration_seconds",
+    "Latency of DatabaseService methods",
+    ["method"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "siteguard_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status_code"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10),
+)
+PROBE_QUEUED = Gauge("siteguard_probe_queued", "Probes waiting for an executor slot")
+PROBE_IN_FLIGHT = Gauge("siteguard_probe_in_flight", "Probes currently running")
+SCHEDULER_LAG = Histogram(
+    "siteguard_scheduler_lag_seconds",
+    "Delay between the planned and the actual start of a scheduled check",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300),
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "siteguard_event_loop_lag_seconds",
+    "How late the event loop wakes up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+def observe_probe(status: str, seconds: float):
+    PROBE_DURATION.labels(status=status).observe(seconds)
+
+
+def observe_scheduler_lag(seconds: float):
+    SCHEDULER_LAG.observe(max(0.0, seconds))
+
+
+def observe_loop_lag(seconds: float):
+    EVENT_LOOP_LAG.observe(seconds)
+
+
+def bind_executor(executor):
+    """Глубина очереди и число проверок читаются из ProbeExecutor в момент сбора"""
+    PROBE_QUEUED.set_function(lambda: executor.queued)
+    PROBE_IN_FLIGHT.set_function(lambda: executor.in_flight)
+
+
+def instrument_async_methods(service, histogram: Histogram = DB_CALL_DURATION):
+    """Замер всех публичных async-методов экземпляра (метка method - имя метода)"""
+    for name, method in inspect.getmembers(service, inspect.iscoroutinefunction):
+        if name.startswith("_"):
+            continue
+        setattr(service, name, _timed(method, histogram.labels(method=name)))
+    return service
+
+
+def _timed(method, child):
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - started)
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware: латентность запросов по шаблону маршрута.
+
+    Метка route берется из найденного маршрута (/api/sites/{site_id}),
+    а не из пути запроса, чтобы число рядов не росло с числом сайтов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status_code=str(status_code),
+            ).observe(time.perf_counter() - started)
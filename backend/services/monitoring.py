@@ -1,49 +1,159 @@
 import aiohttp
 import asyncio
+import re
 import ssl
-import socket
+from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse
 import time
 import certifi
 
-from models import Site, CheckResult, SiteStatus, SiteStats, DashboardStats
+from models import Site, CheckResult, SiteStatus, SiteStats, DashboardStats, ProbeMode
+from services.cache import TTLCache
+from services import metrics
+from services.executor import ProbeExecutor
+from services.tracing import ProbeTimings, create_timing_trace_config
+
+# Сколько байт предыдущего фрагмента сохраняется для поиска регулярного
+# выражения на стыке фрагментов (совпадения длиннее могут быть пропущены)
+REGEX_OVERLAP_BYTES = 1024
+
+@lru_cache(maxsize=1024)
+def compile_keyword(keyword: str, is_regex: bool = False) -> "re.Pattern[bytes]":
+    """Шаблон поиска по байтам тела; re.error для некорректного выражения"""
+    pattern = keyword.encode("utf-8")
+    return re.compile(pattern if is_regex else re.escape(pattern))
 
 class MonitoringService:
-    def __init__(self):
-        self.timeout = aiohttp.ClientTimeout(total=30)
+    def __init__(
+        self,
+        pool_size: int = 1000,
+        per_host_limit: int = 10,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        ssl_cache_ttl: float = 6 * 3600,
+        ssl_error_ttl: float = 300,
+        ssl_timeout: float = 10.0,
+        ssl_cache_size: int = 10000,
+        max_concurrency: int = 200,
+        per_host_concurrency: int = 4,
+        per_host_rate: Optional[float] = None,
+        max_body_bytes: int = 64 * 1024,
+        keyword_scan_bytes: int = 1024 * 1024,
+        chunk_size: int = 16 * 1024,
+        get_drain_bytes: int = 64 * 1024,
+        request_timeout: float = 30.0,
+    ):
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout)
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        # Лимиты чтения тела по умолчанию для режимов get_capped и keyword
+        self.max_body_bytes = max_body_bytes
+        self.keyword_scan_bytes = keyword_scan_bytes
+        self.chunk_size = chunk_size
+        # Режим get: столько байт дочитывается ради keep-alive, большее тело закрывается
+        self.get_drain_bytes = get_drain_bytes
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Кэш сертификатов: "host:port" -> данные сертификата (ошибки живут ssl_error_ttl)
+        self.ssl_cache_ttl = ssl_cache_ttl
+        self.ssl_error_ttl = ssl_error_ttl
+        self.ssl_timeout = ssl_timeout
+        self._ssl_context = ssl.create_default_context()
+        self._ssl_cache = TTLCache(maxsize=ssl_cache_size, ttl=ssl_cache_ttl)
+        # Идущие TLS-рукопожатия: одновременные проверки одного хоста ждут одно
+        self._ssl_in_flight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self.executor = ProbeExecutor(
+            self.check_site,
+            max_concurrency=max_concurrency,
+            per_host_concurrency=per_host_concurrency,
+            per_host_rate=per_host_rate
+        )
+    
+    async def start(self):
+        """Создание общей сессии с пулом соединений"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.per_host_limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            ssl=False
+        )
+        self._session = aiohttp.ClientSession(
+            timeout=self.timeout,
+            connector=connector,
+            trace_configs=[create_timing_trace_config()]
+        )
+    
+    async def close(self):
+        """Закрытие общей сессии"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия; создается при первом обращении, если start() не вызывался"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
         
     async def check_site(self, site: Site) -> CheckResult:
         """Проверка доступности сайта"""
-        start_time = time.time()
+        started = time.perf_counter()
+        result = await self._probe(site)
+        metrics.observe_probe(result.status.value, time.perf_counter() - started)
+        return result
+    
+    async def _probe(self, site: Site) -> CheckResult:
+        timings = ProbeTimings()
         
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(str(site.url), ssl=False) as response:
-                    response_time = (time.time() - start_time) * 1000  # в миллисекундах
-                    
-                    if response.status == 200:
-                        status = SiteStatus.ONLINE
-                    elif 200 <= response.status < 400:
-                        status = SiteStatus.ONLINE
-                    elif 400 <= response.status < 500:
-                        status = SiteStatus.WARNING
-                    else:
-                        status = SiteStatus.OFFLINE
-                    
-                    # Проверка SSL сертификата
-                    ssl_info = await self._check_ssl_certificate(site.url)
-                    
-                    return CheckResult(
-                        site_id=site.id,
-                        status=status,
-                        response_time=response_time,
-                        status_code=response.status,
-                        checked_at=datetime.utcnow(),
-                        ssl_info=ssl_info
-                    )
-                    
+            session = await self._get_session()
+            method = "HEAD" if site.probe_mode == ProbeMode.HEAD else "GET"
+            async with session.request(
+                method, str(site.url), allow_redirects=True, trace_request_ctx=timings
+            ) as response:
+                # Время до первого байта ответа, в миллисекундах
+                response_time = timings.ttfb
+                body_bytes, keyword_found = await self._read_body(response, site)
+                timings.finish()
+                
+                if response.status == 200:
+                    status = SiteStatus.ONLINE
+                elif 200 <= response.status < 400:
+                    status = SiteStatus.ONLINE
+                elif 400 <= response.status < 500:
+                    status = SiteStatus.WARNING
+                else:
+                    status = SiteStatus.OFFLINE
+                status_code = response.status
+            
+            error_message = None
+            if status == SiteStatus.ONLINE and keyword_found is False:
+                # Сайт отвечает, но без ожидаемого содержимого
+                status = SiteStatus.WARNING
+                error_message = f"Keyword not found in first {body_bytes} bytes"
+            
+            # Проверка SSL сертификата (после возврата соединения в пул)
+            ssl_info = await self._check_ssl_certificate(site.url)
+            
+            return CheckResult(
+                site_id=site.id,
+                status=status,
+                response_time=response_time,
+                status_code=status_code,
+                error_message=error_message,
+                checked_at=datetime.utcnow(),
+                ssl_info=ssl_info,
+                body_bytes=body_bytes,
+                keyword_found=keyword_found,
+                **timings.as_fields()
+            )
+                
         except aiohttp.ClientError as e:
             return CheckResult(
                 site_id=site.id,
@@ -53,6 +163,16 @@ class MonitoringService:
                 error_message=str(e),
                 checked_at=datetime.utcnow()
             )
+        except asyncio.TimeoutError:
+            # Зависший сайт - это недоступность, а не ошибка самой проверки
+            return CheckResult(
+                site_id=site.id,
+                status=SiteStatus.OFFLINE,
+                response_time=None,
+                status_code=None,
+                error_message=f"Request timed out after {self.timeout.total}s",
+                checked_at=datetime.utcnow()
+            )
         except Exception as e:
             return CheckResult(
                 site_id=site.id,
@@ -63,50 +183,117 @@ class MonitoringService:
                 checked_at=datetime.utcnow()
             )
     
+    async def _read_body(self, response: aiohttp.ClientResponse, site: Site) -> Tuple[int, Optional[bool]]:
+        """Чтение тела по режиму проверки: (прочитано байт, найдено ли ключевое слово)"""
+        if site.probe_mode == ProbeMode.HEAD:
+            return 0, None
+        
+        pattern = None
+        overlap = 0
+        limit = site.max_body_bytes if site.max_body_bytes is not None else self.max_body_bytes
+        if site.probe_mode == ProbeMode.GET:
+            # Небольшое тело дочитываем, чтобы соединение вернулось в пул keep-alive
+            limit = self.get_drain_bytes
+        elif site.probe_mode == ProbeMode.KEYWORD and site.keyword:
+            pattern = compile_keyword(site.keyword, site.keyword_is_regex)
+            overlap = REGEX_OVERLAP_BYTES if site.keyword_is_regex else len(site.keyword.encode("utf-8")) - 1
+            if site.max_body_bytes is None:
+                limit = self.keyword_scan_bytes
+        
+        read = 0
+        found = False
+        tail = b""
+        while read < limit:
+            # Не больше остатка лимита: байты за лимитом не читаются и не ищутся
+            chunk = await response.content.read(min(self.chunk_size, limit - read))
+            if not chunk:
+                break
+            read += len(chunk)
+            if pattern is not None:
+                window = tail + chunk
+                if pattern.search(window):
+                    found = True
+                    break
+                tail = window[-overlap:] if overlap > 0 else b""
+        
+        if not response.content.at_eof():
+            # Остаток тела не нужен - закрываем соединение, не дочитывая его
+            response.close()
+        return read, (found if pattern is not None else None)
+    
     async def _check_ssl_certificate(self, url: str) -> Optional[Dict[str, Any]]:
-        """Проверка SSL сертификата"""
+        """Проверка SSL сертификата (с кэшированием по хосту)"""
+        parsed_url = urlparse(str(url))
+        if parsed_url.scheme != 'https':
+            return None
+        
+        hostname = parsed_url.hostname
+        port = parsed_url.port or 443
+        key = f"{hostname}:{port}"
+        
+        cert_info = self._ssl_cache.get(key)
+        if cert_info is None:
+            task = self._ssl_in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._load_ssl_certificate(key, hostname, port))
+                self._ssl_in_flight[key] = task
+                task.add_done_callback(lambda _: self._ssl_in_flight.pop(key, None))
+            # Отмена одной проверки не прерывает рукопожатие, которого ждут другие
+            cert_info = await asyncio.shield(task)
+        
+        if 'error' in cert_info:
+            return dict(cert_info)
+        # Срок до истечения пересчитываем при каждом обращении к кэшу
+        expiry_date = datetime.fromisoformat(cert_info['not_after'])
+        return {**cert_info, 'expires_in_days': (expiry_date - datetime.utcnow()).days}
+    
+    async def _load_ssl_certificate(self, key: str, hostname: str, port: int) -> Dict[str, Any]:
+        cert_info = await self._fetch_ssl_certificate(hostname, port)
+        ttl = self.ssl_error_ttl if 'error' in cert_info else self.ssl_cache_ttl
+        self._ssl_cache.set(key, cert_info, ttl)
+        return cert_info
+    
+    async def _fetch_ssl_certificate(self, hostname: str, port: int) -> Dict[str, Any]:
+        """Чтение сертификата через неблокирующее TLS-соединение"""
+        writer = None
         try:
-            parsed_url = urlparse(str(url))
-            if parsed_url.scheme != 'https':
-                return None
-                
-            hostname = parsed_url.hostname
-            port = parsed_url.port or 443
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    hostname, port, ssl=self._ssl_context, server_hostname=hostname
+                ),
+                timeout=self.ssl_timeout
+            )
+            cert = writer.get_extra_info('peercert')
             
-            # Создаем SSL контекст
-            context = ssl.create_default_context()
+            # Парсим дату истечения
+            expiry_date = datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z')
             
-            # Подключаемся к серверу
-            with socket.create_connection((hostname, port), timeout=10) as sock:
-                with context.wrap_socket(sock, server_hostname=hostname) as ssock:
-                    cert = ssock.getpeercert()
-                    
-                    # Парсим дату истечения
-                    expiry_date = datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z')
-                    
-                    return {
-                        'issuer': dict(x[0] for x in cert['issuer']),
-                        'subject': dict(x[0] for x in cert['subject']),
-                        'serial_number': cert['serialNumber'],
-                        'not_before': datetime.strptime(cert['notBefore'], '%b %d %H:%M:%S %Y %Z').isoformat(),
-                        'not_after': expiry_date.isoformat(),
-                        'expires_in_days': (expiry_date - datetime.utcnow()).days
-                    }
+            return {
+                'issuer': dict(x[0] for x in cert['issuer']),
+                'subject': dict(x[0] for x in cert['subject']),
+                'serial_number': cert['serialNumber'],
+                'not_before': datetime.strptime(cert['notBefore'], '%b %d %H:%M:%S %Y %Z').isoformat(),
+                'not_after': expiry_date.isoformat()
+            }
+        except asyncio.TimeoutError:
+            return {'error': f"TLS handshake timed out after {self.ssl_timeout}s"}
         except Exception as e:
             return {'error': str(e)}
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    await asyncio.wait_for(writer.wait_closed(), timeout=1)
+                except Exception:
+                    pass
     
     async def check_multiple_sites(self, sites: List[Site]) -> List[CheckResult]:
-        """Проверка нескольких сайтов одновременно"""
-        tasks = [self.check_site(site) for site in sites]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Фильтруем исключения
-        valid_results = []
-        for result in results:
-            if isinstance(result, CheckResult):
-                valid_results.append(result)
-        
-        return valid_results
+        """Проверка нескольких сайтов с ограничением параллелизма"""
+        return [result async for result in self.executor.map(sites)]
+    
+    def iter_check_results(self, sites: List[Site]) -> AsyncIterator[CheckResult]:
+        """Проверка нескольких сайтов; результаты отдаются по мере готовности"""
+        return self.executor.map(sites)
     
     def calculate_uptime_percentage(self, checks: List[CheckResult]) -> float:
         """Расчет процента uptime"""
@@ -121,4 +308,4 @@ class MonitoringService:
         response_times = [check.response_time for check in checks if check.response_time is not None]
         if not response_times:
             return 0.0
-        return sum(response_times) / len(response_times)
\ No newline at end of file
+        return sum(response_times) / len(response_times)
@@ -0,0 +1,77 @@
+import math
+from typing import Dict, Iterable, Optional
+
+# Значения меньше этого порога (мс) попадают в нулевую корзину
+MIN_VALUE = 1e-3
+ZERO_KEY = "z"
+
+
+class LatencySketch:
+    """Мергируемый скетч квантилей с логарифмическими корзинами (по схеме DDSketch).
+
+    Квантиль возвращается с относительной погрешностью не больше relative_accuracy.
+    Корзины хранятся как {ключ: количество} и складываются через $inc в MongoDB.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, bins: Optional[Dict[str, int]] = None):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: Dict[str, int] = dict(bins or {})
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def key(self, value: float) -> str:
+        """Ключ корзины для значения"""
+        if value < MIN_VALUE:
+            return ZERO_KEY
+        return str(int(math.ceil(math.log(value) / self.log_gamma)))
+
+    def add(self, value: float, count: int = 1):
+        key = self.key(value)
+        self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, bins: Dict[str, int]):
+        """Слияние с корзинами другого скетча той же точности"""
+        for key, count in bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def _value(self, key: str) -> float:
+        if key == ZERO_KEY:
+            return 0.0
+        return 2 * self.gamma ** int(key) / (self.gamma + 1)
+
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, Optional[float]]:
+        """Значения нескольких квантилей за один проход по корзинам"""
+        qs = sorted(qs)
+        total = self.count
+        if not total:
+            return {q: None for q in qs}
+        ordered = sorted(self.bins.items(), key=lambda item: -math.inf if item[0] == ZERO_KEY else int(item[0]))
+        result: Dict[float, Optional[float]] = {}
+        seen = 0
+        index = 0
+        for key, count in ordered:
+            seen += count
+            while index < len(qs) and seen > qs[index] * (total - 1):
+                result[qs[index]] = self._value(key)
+                index += 1
+            if index == len(qs):
+                break
+        for q in qs[index:]:
+            result[q] = self._value(ordered[-1][0])
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[q]
+
+
+def merge_sketches(bins_list: Iterable[Optional[Dict[str, int]]], relative_accuracy: float = 0.01) -> LatencySketch:
+    """Объединение корзин из нескольких временных интервалов"""
+    sketch = LatencySketch(relative_accuracy)
+    for bins in bins_list:
+        if bins:
+            sketch.merge(bins)
+    return sketch
@@ -0,0 +1,319 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from database import WriteProgress
+from models import Site, CheckResult, SiteStatus
+from services import metrics
+from services.intervals import IntervalPolicy, SiteHealth
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором неудачной загрузки списка сайтов
+REFRESH_RETRY_DELAY = 10.0
+# Сколько пачек результатов держать в памяти, пока база недоступна
+MAX_PENDING_BATCHES = 100
+
+# Обработчик сохраненной пачки: пары (сайт до проверки, результат)
+ResultsListener = Callable[[List[Tuple[Site, CheckResult]]], Awaitable[None]]
+
+
+class CheckScheduler:
+    """Фоновый планировщик проверок сайтов.
+
+    Держит кучу (heap) сайтов, упорядоченную по времени следующей проверки,
+    и запускает MonitoringService.check_site с постоянной скоростью.
+    """
+
+    def __init__(
+        self,
+        db_service,
+        monitoring_service,
+        rate: float = 20.0,
+        jitter: float = 0.1,
+        max_in_flight: int = 100,
+        refresh_interval: float = 60.0,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        site_filter: Optional[Callable[[Site], bool]] = None,
+        interval_policy: Optional[IntervalPolicy] = None,
+    ):
+        self.db_service = db_service
+        self.monitoring_service = monitoring_service
+        self.rate = rate  # проверок в секунду
+        self.jitter = jitter  # доля интервала для случайного сдвига
+        self.max_in_flight = max_in_flight
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Отбор сайтов этого процесса (например, по арендованным партициям)
+        self.site_filter = site_filter
+        self.interval_policy = interval_policy or IntervalPolicy()
+
+        self._heap: List[Tuple[float, int, str]] = []
+        self._due: Dict[str, float] = {}
+        self._sites: Dict[str, Site] = {}
+        self._health: Dict[str, SiteHealth] = {}
+        self._in_flight: Set[str] = set()
+        self._counter = itertools.count()
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending: List[Tuple[Site, CheckResult]] = []
+        self.listeners: List[ResultsListener] = []
+        self._flush_needed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        # Выполненные шаги записи пачки, упавшей на середине: повтор их не дублирует
+        self._write_progress = WriteProgress()
+        self._next_slot = 0.0
+        self._last_refresh = float("-inf")
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    async def start(self):
+        """Запуск планировщика"""
+        if self.running:
+            return
+        # Список сайтов загружается в первой итерации цикла, чтобы недоступная
+        # база не мешала запуску приложения
+        self._runner = asyncio.create_task(self._run())
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info("Check scheduler started")
+
+    async def stop(self):
+        """Остановка планировщика"""
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._flusher:
+            # Начатая запись не прерывается: flush() ниже дождется ее через _flush_lock
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to persist scheduled check results")
+        logger.info("Check scheduler stopped")
+
+    async def refresh_sites(self):
+        """Синхронизация кучи с актуальным списком сайтов"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        sites = await self.db_service.get_all_sites()
+        current = {site.id: site for site in sites if self._accepts(site)}
+
+        # Удаленные сайты просто забываем - их записи в куче станут неактуальными
+        for site_id in list(self._sites):
+            if site_id not in current:
+                self._sites.pop(site_id, None)
+                self._due.pop(site_id, None)
+                self._health.pop(site_id, None)
+
+        for site_id, site in current.items():
+            previous = self._sites.get(site_id)
+            self._sites[site_id] = site
+            if site_id in self._in_flight:
+                continue
+            if previous is None:
+                self._health.setdefault(site_id, self._initial_health(site))
+                self._push(site_id, now + self._initial_delay(site))
+            elif self._interval_settings(previous) != self._interval_settings(site):
+                self._push(site_id, now + self._next_delay(site))
+
+        self._last_refresh = now
+
+    def request_refresh(self):
+        """Перечитать список сайтов в ближайшей итерации цикла"""
+        self._last_refresh = float("-inf")
+
+    def _accepts(self, site: Site) -> bool:
+        return self.site_filter is None or self.site_filter(site)
+
+    @staticmethod
+    def _interval_settings(site: Site) -> Tuple[int, Optional[int], Optional[int]]:
+        return site.check_interval, site.check_interval_min, site.check_interval_max
+
+    def _initial_health(self, site: Site) -> SiteHealth:
+        """Серия по сохраненному статусу: стабильный сайт не начинает с частых проверок"""
+        health = SiteHealth()
+        if site.status == SiteStatus.ONLINE:
+            health.successes = self.interval_policy.stable_checks
+        elif site.status != SiteStatus.UNKNOWN:
+            health.failures = 1
+        return health
+
+    def _initial_delay(self, site: Site) -> float:
+        """Задержка первой проверки с учетом времени последней проверки"""
+        interval = self._interval(site)
+        delay = 0.0
+        if site.last_check:
+            elapsed = (datetime.utcnow() - site.last_check).total_seconds()
+            delay = max(0.0, interval - elapsed)
+        return delay + random.uniform(0, interval * self.jitter)
+
+    def _interval(self, site: Site) -> float:
+        return self.interval_policy.interval(site, self._health.get(site.id))
+
+    def _next_delay(self, site: Site) -> float:
+        """Интервал до следующей проверки со случайным сдвигом"""
+        interval = self._interval(site)
+        spread = interval * self.jitter
+        return max(1.0, interval + random.uniform(-spread, spread))
+
+    def _push(self, site_id: str, due: float):
+        self._due[site_id] = due
+        heapq.heappush(self._heap, (due, next(self._counter), site_id))
+
+    def _pop_due(self, now: float) -> Optional[Tuple[str, float]]:
+        """Извлечение следующего сайта, время проверки которого наступило"""
+        while self._heap:
+            due, _, site_id = self._heap[0]
+            if self._due.get(site_id) != due:
+                # Устаревшая запись (сайт удален или перепланирован)
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                return None
+            heapq.heappop(self._heap)
+            del self._due[site_id]
+            return site_id, due
+        return None
+
+    def _seconds_until_due(self, now: float) -> float:
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return self.refresh_interval
+        return max(0.0, self._heap[0][0] - now)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                now = loop.time()
+                if now - self._last_refresh >= self.refresh_interval:
+                    try:
+                        await self.refresh_sites()
+                    except Exception:
+                        # Известные сайты продолжают проверяться, список перечитаем позже
+                        logger.exception("Failed to refresh site list")
+                        retry = min(self.refresh_interval, REFRESH_RETRY_DELAY)
+                        self._last_refresh = now - self.refresh_interval + retry
+                    now = loop.time()
+
+                popped = self._pop_due(now)
+                if popped is None:
+                    await asyncio.sleep(min(self._seconds_until_due(now), 1.0))
+                    continue
+                site_id, due = popped
+
+                # Равномерный темп: не более rate проверок в секунду
+                self._next_slot = max(self._next_slot + 1.0 / self.rate, now)
+                if self._next_slot > now:
+                    await asyncio.sleep(self._next_slot - now)
+
+                await self._semaphore.acquire()
+                site = self._sites.get(site_id)
+                if site is None or not self._accepts(site):
+                    # Сайт удален или больше не относится к этому процессу
+                    self._sites.pop(site_id, None)
+                    self._semaphore.release()
+                    continue
+                # Отставание от плана: темп rate, занятые слоты и загрузка цикла
+                metrics.observe_scheduler_lag(loop.time() - due)
+                self._in_flight.add(site_id)
+                task = asyncio.create_task(self._check(site))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Check scheduler iteration failed")
+                await asyncio.sleep(1.0)
+
+    async def _check(self, site: Site):
+        try:
+            result = await self.monitoring_service.executor.run(site)
+            self._pending.append((site, result))
+            if site.id in self._sites:
+                self._health.setdefault(site.id, SiteHealth()).record(result.status)
+                # Запоминаем новый статус, чтобы следующая проверка видела переход
+                self._sites[site.id] = site.copy(update={
+                    "status": result.status,
+                    "last_check": result.checked_at,
+                    "response_time": result.response_time
+                })
+            overflow = len(self._pending) - self.batch_size * MAX_PENDING_BATCHES
+            if overflow > 0 and not self._flush_lock.locked():
+                # Во время записи начало очереди не трогаем - flush удалит его сам
+                self._write_progress.forget(result.id for _, result in self._pending[:overflow])
+                del self._pending[:overflow]
+                logger.warning("Dropped %d unsaved check results, database is not keeping up", overflow)
+            if len(self._pending) >= self.batch_size:
+                self._flush_needed.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Scheduled check failed for site %s", site.id)
+        finally:
+            self._semaphore.release()
+            self._in_flight.discard(site.id)
+            current = self._sites.get(site.id)
+            if current is not None:
+                loop = asyncio.get_running_loop()
+                self._push(site.id, loop.time() + self._next_delay(current))
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                # Отмена при остановке не обрывает запись пачки на середине
+                await asyncio.shield(self.flush())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to persist scheduled check results")
+
+    async def flush(self):
+        """Пакетное сохранение накопленных результатов и статусов сайтов.
+
+        Пачка удаляется из очереди только после успешной записи: при ошибке
+        она останется в _pending и будет дописана следующим вызовом без
+        повторения уже выполненных шагов (см. WriteProgress).
+        """
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                results = [result for _, result in batch]
+                await self.db_service.record_check_results(results, self._write_progress)
+                self._write_progress.forget(result.id for result in results)
+                # Новые результаты добавляются в конец, начало очереди за время записи не менялось
+                del self._pending[:len(batch)]
+                for listener in self.listeners:
+                    try:
+                        await listener(batch)
+                    except Exception:
+                        logger.exception("Check results listener failed")
@@ -0,0 +1,94 @@
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import aiohttp
+
+
+class ProbeTimings:
+    """Отметки времени одной проверки (монотонные часы, perf_counter)"""
+
+    def __init__(self):
+        self.start: Optional[float] = None
+        self.headers_received: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.dns = 0.0
+        self.connect = 0.0
+        self._dns_start: Optional[float] = None
+        self._connect_start: Optional[float] = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @staticmethod
+    def _ms(seconds: Optional[float]) -> Optional[float]:
+        return seconds * 1000 if seconds is not None else None
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        """Время до получения заголовков ответа, мс"""
+        if self.start is None or self.headers_received is None:
+            return None
+        return self._ms(self.headers_received - self.start)
+
+    def as_fields(self) -> Dict[str, Optional[float]]:
+        """Поля для CheckResult (в миллисекундах)"""
+        total = None
+        if self.start is not None and self.finished is not None:
+            total = self.finished - self.start
+        return {
+            "dns_time": self._ms(self.dns),
+            # Создание соединения в aiohttp включает резолвинг - вычитаем его
+            "connect_time": self._ms(max(0.0, self.connect - self.dns)),
+            "ttfb": self.ttfb,
+            "total_time": self._ms(total),
+        }
+
+
+async def _on_request_start(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    if timings.start is None:
+        timings.start = time.perf_counter()
+
+
+async def _on_request_end(session, ctx, params):
+    ctx.trace_request_ctx.headers_received = time.perf_counter()
+
+
+async def _on_dns_resolvehost_start(session, ctx, params):
+    ctx.trace_request_ctx._dns_start = time.perf_counter()
+
+
+async def _on_dns_resolvehost_end(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    if timings._dns_start is not None:
+        timings.dns += time.perf_counter() - timings._dns_start
+        timings._dns_start = None
+
+
+async def _on_connection_create_start(session, ctx, params):
+    ctx.trace_request_ctx._connect_start = time.perf_counter()
+
+
+async def _on_connection_create_end(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    if timings._connect_start is not None:
+        timings.connect += time.perf_counter() - timings._connect_start
+        timings._connect_start = None
+
+
+def _timing_ctx_factory(trace_request_ctx=None):
+    # Запросы без ProbeTimings (не из check_site) получают временный объект
+    return SimpleNamespace(trace_request_ctx=trace_request_ctx or ProbeTimings())
+
+
+def create_timing_trace_config() -> aiohttp.TraceConfig:
+    """TraceConfig, записывающий фазы запроса в ProbeTimings из trace_request_ctx"""
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=_timing_ctx_factory)
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    return trace_config
@@ -0,0 +1,140 @@
+"""Отдельный процесс проверок сайтов.
+
+Несколько воркеров делят сайты между собой через аренду партиций в MongoDB
+(services/leases.py). Запуск из каталога backend:
+    python worker.py
+
+API при этом можно запускать с SCHEDULER_ENABLED=false.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from database import DatabaseService
+from services import metrics
+from services.diagnostics import LoopLagMonitor
+from services.incidents import IncidentEngine
+from services.leases import LeaseManager
+from services.monitoring import MonitoringService
+from services.scheduler import CheckScheduler
+from services.intervals import IntervalPolicy
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("worker")
+
+
+def build_worker_id() -> str:
+    return os.environ.get('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    db_service = DatabaseService(
+        db,
+        checks_storage=os.environ.get('CHECKS_STORAGE', 'standard'),
+        raw_checks_ttl_days=int(os.environ['CHECKS_RAW_TTL_DAYS']) if os.environ.get('CHECKS_RAW_TTL_DAYS') else None,
+    )
+    monitoring_service = MonitoringService(
+        pool_size=int(os.environ.get('PROBE_POOL_SIZE', '1000')),
+        per_host_limit=int(os.environ.get('PROBE_PER_HOST_LIMIT', '10')),
+        keepalive_timeout=float(os.environ.get('PROBE_KEEPALIVE_TIMEOUT', '30')),
+        dns_cache_ttl=int(os.environ.get('PROBE_DNS_CACHE_TTL', '300')),
+        max_concurrency=int(os.environ.get('PROBE_MAX_CONCURRENCY', '200')),
+        per_host_concurrency=int(os.environ.get('PROBE_HOST_CONCURRENCY', '4')),
+        per_host_rate=float(os.environ['PROBE_HOST_RATE']) if os.environ.get('PROBE_HOST_RATE') else None,
+        max_body_bytes=int(os.environ.get('PROBE_MAX_BODY_BYTES', '65536')),
+        get_drain_bytes=int(os.environ.get('PROBE_GET_DRAIN_BYTES', '65536')),
+        keyword_scan_bytes=int(os.environ.get('PROBE_KEYWORD_SCAN_BYTES', '1048576')),
+        request_timeout=float(os.environ.get('PROBE_TIMEOUT', '30')),
+    )
+    metrics.instrument_async_methods(db_service)
+    metrics.bind_executor(monitoring_service.executor)
+    if os.environ.get('WORKER_METRICS_PORT'):
+        # У воркера нет HTTP API - метрики отдаются отдельным сервером
+        metrics.start_http_server(int(os.environ['WORKER_METRICS_PORT']))
+    lease_manager = LeaseManager(
+        db,
+        worker_id=build_worker_id(),
+        partitions=int(os.environ.get('WORKER_PARTITIONS', '64')),
+        lease_ttl=float(os.environ.get('WORKER_LEASE_TTL', '30')),
+        renew_interval=float(os.environ.get('WORKER_RENEW_INTERVAL', '10')),
+    )
+    scheduler = CheckScheduler(
+        db_service,
+        monitoring_service,
+        rate=float(os.environ.get('SCHEDULER_RATE', '20')),
+        jitter=float(os.environ.get('SCHEDULER_JITTER', '0.1')),
+        max_in_flight=int(os.environ.get('SCHEDULER_MAX_IN_FLIGHT', '100')),
+        refresh_interval=float(os.environ.get('SCHEDULER_REFRESH_INTERVAL', '60')),
+        batch_size=int(os.environ.get('RESULTS_BATCH_SIZE', '100')),
+        flush_interval=float(os.environ.get('SCHEDULER_FLUSH_INTERVAL', '1')),
+        interval_policy=IntervalPolicy(
+            growth=float(os.environ.get('SCHEDULER_INTERVAL_GROWTH', '1.5')),
+            stable_checks=int(os.environ.get('SCHEDULER_STABLE_CHECKS', '3')),
+        ),
+        site_filter=lease_manager.owns,
+    )
+    incident_engine = IncidentEngine(
+        db_service,
+        confirm_failures=int(os.environ.get('INCIDENT_CONFIRM_FAILURES', '3')),
+        window=int(os.environ.get('INCIDENT_WINDOW', '5')),
+        recover_successes=int(os.environ.get('INCIDENT_RECOVER_SUCCESSES', '2')),
+        flap_window=float(os.environ.get('INCIDENT_FLAP_WINDOW', '300')),
+    )
+    scheduler.listeners.append(incident_engine.process)
+    # Новые партиции подхватываются сразу, не дожидаясь refresh_interval
+    lease_manager.listeners.append(lambda owned: scheduler.request_refresh())
+
+    loop_monitor = LoopLagMonitor(
+        interval=float(os.environ.get('LOOP_LAG_INTERVAL', '0.5')),
+        stall_threshold=float(os.environ.get('LOOP_STALL_THRESHOLD', '0.25')),
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await db_service.ensure_indexes()
+    except Exception as e:
+        logger.error("Index bootstrap failed: %s", e)
+    try:
+        if await db_service.backfill_rollups():
+            logger.info("Rollups backfilled from raw checks")
+    except Exception as e:
+        logger.error("Rollup backfill failed: %s", e)
+    await loop_monitor.start()
+    await monitoring_service.start()
+    await lease_manager.start()
+    await scheduler.start()
+    logger.info("Worker %s started", lease_manager.worker_id)
+
+    try:
+        await stop_event.wait()
+    finally:
+        await scheduler.stop()
+        await lease_manager.stop()
+        await monitoring_service.close()
+        await loop_monitor.stop()
+        client.close()
+        logger.info("Worker %s stopped", lease_manager.worker_id)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
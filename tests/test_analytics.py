@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+from mongomock_motor import AsyncMongoMockClient
+
+from database import DatabaseService
+from models import CheckResult, SiteStatus
+from services.analytics import CheckSeries
+
+START = datetime(2024, 1, 1, 23, 0, 0)
+
+
+def make_checks(count):
+    statuses = [SiteStatus.ONLINE, SiteStatus.ONLINE, SiteStatus.OFFLINE, SiteStatus.WARNING]
+    return [
+        CheckResult(
+            site_id="site",
+            status=statuses[i % len(statuses)],
+            status_code=None if i % 5 == 0 else 200,
+            response_time=None if i % 3 == 0 else float(i),
+            checked_at=START + timedelta(minutes=7 * i),
+        )
+        for i in range(count)
+    ]
+
+
+def test_loaded_series_matches_documents():
+    checks = make_checks(500)
+
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        # Вставка в обратном порядке: колонки из разных суток собираются по времени
+        await db.checks.insert_many([check.dict() for check in reversed(checks)])
+        await db.checks.insert_one(CheckResult(site_id="other", status=SiteStatus.OFFLINE).dict())
+        return await DatabaseService(db).load_check_series("site")
+
+    loaded = asyncio.run(scenario())
+    expected = CheckSeries.from_documents(check.dict() for check in checks)
+
+    assert len(loaded) == 500
+    assert np.array_equal(loaded.timestamps, expected.timestamps)
+    assert np.array_equal(loaded.online, expected.online)
+    assert np.array_equal(loaded.status_codes, expected.status_codes)
+    assert np.array_equal(loaded.latency, expected.latency, equal_nan=True)
+    assert loaded.uptime_percentage() == 50.0
+
+
+def test_empty_series():
+    series = CheckSeries.from_column_chunks([])
+
+    assert len(series) == 0
+    assert series.uptime_percentage() == 0.0
+    assert series.trend(timedelta(days=1)) == []
@@ -0,0 +1,104 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from database import DatabaseService, decode_checks_cursor, encode_checks_cursor
+from models import CheckResult, SiteStatus
+
+SITE_ID = "site"
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def make_service(count, same_time_every=3):
+    """count проверок; каждые same_time_every подряд имеют одинаковое checked_at"""
+    db = AsyncMongoMockClient()["test"]
+    checks = [
+        CheckResult(
+            id=f"check-{i:03d}",
+            site_id=SITE_ID,
+            status=SiteStatus.ONLINE,
+            checked_at=START + timedelta(seconds=i // same_time_every),
+        ).dict()
+        for i in range(count)
+    ]
+    other = CheckResult(site_id="other-site", status=SiteStatus.ONLINE, checked_at=START).dict()
+
+    async def fill():
+        await db.checks.insert_many(checks + [other])
+
+    asyncio.run(fill())
+    expected = [check["id"] for check in sorted(checks, key=lambda c: (c["checked_at"], c["id"]), reverse=True)]
+    return DatabaseService(db), expected
+
+
+def walk(service, limit):
+    """Все страницы от новых к старым по next_cursor"""
+    async def pages():
+        collected = [await service.get_site_checks_page(SITE_ID, limit)]
+        while collected[-1].next_cursor is not None:
+            collected.append(await service.get_site_checks_page(SITE_ID, limit, before=collected[-1].next_cursor))
+        return collected
+
+    return asyncio.run(pages())
+
+
+def test_cursor_roundtrip():
+    check = {"checked_at": START, "id": "abc"}
+    assert decode_checks_cursor(encode_checks_cursor(check)) == (START, "abc")
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", base64.urlsafe_b64encode(b'{"t": "x"}').decode()])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_checks_cursor(cursor)
+
+
+@pytest.mark.parametrize("count,limit", [(10, 3), (9, 3), (3, 3), (1, 5)])
+def test_forward_walk_returns_every_check_once_in_order(count, limit):
+    service, expected = make_service(count)
+
+    pages = walk(service, limit)
+
+    assert [item.id for page in pages for item in page.items] == expected
+    assert all(len(page.items) == limit for page in pages[:-1])
+    assert pages[0].prev_cursor is None
+    assert pages[-1].next_cursor is None
+
+
+def test_backward_walk_from_oldest_page():
+    service, expected = make_service(10)
+    oldest = walk(service, 4)[-1]
+
+    collected = [item.id for item in oldest.items]
+
+    async def back():
+        page = oldest
+        while page.prev_cursor is not None:
+            page = await service.get_site_checks_page(SITE_ID, 4, after=page.prev_cursor)
+            collected[:0] = [item.id for item in page.items]
+            # Страница, полученная через after, всегда ведет обратно к более старым
+            assert page.next_cursor is not None
+
+    asyncio.run(back())
+    assert collected == expected
+
+
+def test_ties_on_checked_at_are_split_by_id():
+    service, expected = make_service(6, same_time_every=6)
+
+    pages = walk(service, 4)
+
+    assert [item.id for page in pages for item in page.items] == expected
+    assert len({item.checked_at for page in pages for item in page.items}) == 1
+
+
+def test_empty_history_has_no_cursors():
+    service, _ = make_service(0)
+
+    page = asyncio.run(service.get_site_checks_page(SITE_ID, 10))
+
+    assert page.items == []
+    assert page.next_cursor is None and page.prev_cursor is None
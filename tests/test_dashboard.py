@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from database import DatabaseService
+from models import CheckResult, Site, SiteStatus
+
+
+def test_dashboard_counts_current_site_statuses():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        service = DatabaseService(db)
+        sites = [Site(name=f"site-{i}", url=f"http://site-{i}.test", owner_id="owner") for i in range(5)]
+        for site in sites:
+            await service.create_site(site)
+        statuses = [SiteStatus.ONLINE, SiteStatus.OFFLINE, SiteStatus.WARNING, SiteStatus.OFFLINE]
+        await service.record_check_results([
+            CheckResult(site_id=site.id, status=check_status) for site, check_status in zip(sites, statuses)
+        ])
+        # Более старая проверка недоступного сайта не попадает в recent_incidents
+        await db.checks.insert_one(CheckResult(
+            site_id=sites[1].id, status=SiteStatus.OFFLINE, checked_at=datetime.utcnow() - timedelta(minutes=5)
+        ).dict())
+        return sites, await service.get_dashboard_stats("owner")
+
+    sites, stats = asyncio.run(scenario())
+    assert stats.total_sites == 5
+    # Непроверенный сайт не учитывается ни в одном статусе
+    assert (stats.online_sites, stats.offline_sites, stats.warning_sites) == (1, 2, 1)
+    assert stats.total_checks_today == 4
+    assert len(stats.recent_incidents) == 2
+    assert {check.site_id for check in stats.recent_incidents} == {sites[1].id, sites[3].id}
+    assert all(check.checked_at > datetime.utcnow() - timedelta(minutes=1) for check in stats.recent_incidents)
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from database import DatabaseService
+from models import CheckResult, Site, SiteStatus
+from services.events import EventHub
+
+
+def test_slow_subscriber_drops_oldest_and_gets_resync():
+    async def scenario():
+        hub = EventHub(max_queue=3)
+        subscription = hub.subscribe("owner")
+        for i in range(5):
+            hub.publish("owner", {"type": "tick", "data": i})
+        return [await subscription.get(timeout=0.01) for _ in range(5)]
+
+    events = asyncio.run(scenario())
+    assert events[0] == {"type": "resync", "data": {"dropped": 2}}
+    assert [event["data"] for event in events[1:4]] == [2, 3, 4]
+    assert events[4] is None
+
+
+def test_queue_never_exceeds_limit():
+    async def scenario():
+        hub = EventHub(max_queue=10)
+        subscription = hub.subscribe("owner")
+        for i in range(1000):
+            hub.publish("owner", {"type": "tick", "data": i})
+        return subscription
+
+    subscription = asyncio.run(scenario())
+    assert subscription.queue.qsize() == 10
+    assert subscription.dropped == 990
+
+
+def test_events_reach_only_owner_connections():
+    async def scenario():
+        hub = EventHub()
+        first, second = hub.subscribe("owner"), hub.subscribe("owner")
+        other = hub.subscribe("other")
+        delivered = hub.publish("owner", {"type": "tick", "data": 1})
+        first.close()
+        return hub, delivered, second.queue.qsize(), other.queue.qsize()
+
+    hub, delivered, second_size, other_size = asyncio.run(scenario())
+    assert delivered == 2
+    assert (second_size, other_size) == (1, 0)
+    assert hub.connection_count == 2
+
+
+def test_status_change_event_follows_check_result():
+    site = Site(name="site", url="http://site.test", owner_id="owner", status=SiteStatus.ONLINE)
+
+    async def scenario():
+        hub = EventHub()
+        subscription = hub.subscribe("owner")
+        await hub.publish_check_results([
+            (site, CheckResult(site_id=site.id, status=SiteStatus.OFFLINE)),
+            (site.copy(update={"status": SiteStatus.OFFLINE}), CheckResult(site_id=site.id, status=SiteStatus.OFFLINE)),
+        ])
+        return [(await subscription.get(timeout=0.01))["type"] for _ in range(subscription.queue.qsize())]
+
+    assert asyncio.run(scenario()) == ["check_result", "status_change", "check_result"]
+
+
+def test_sse_ticket_is_single_use_and_expires():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        service = DatabaseService(db)
+        ticket = await service.create_sse_ticket("user", ttl=30)
+        first, second = await service.redeem_sse_ticket(ticket), await service.redeem_sse_ticket(ticket)
+        expired = await service.create_sse_ticket("user", ttl=30)
+        await db.sse_tickets.update_many({}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+        stored = await db.sse_tickets.find_one({})
+        return ticket, first, second, await service.redeem_sse_ticket(expired), stored
+
+    ticket, first, second, expired, stored = asyncio.run(scenario())
+    assert (first, second, expired) == ("user", None, None)
+    # В базе хранится только хэш билета
+    assert ticket not in stored["_id"]
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from database import DatabaseService
+from models import CheckResult, Site, SiteStatus
+from services.incidents import IncidentEngine
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+SITE = Site(name="site", url="http://site.test", owner_id="owner")
+
+
+def checks(*statuses, offset=0, step=60):
+    """Пачка результатов по строке статусов: x - offline, w - warning, o - online, ? - unknown"""
+    codes = {"x": SiteStatus.OFFLINE, "w": SiteStatus.WARNING, "o": SiteStatus.ONLINE, "?": SiteStatus.UNKNOWN}
+    return [
+        (SITE, CheckResult(site_id=SITE.id, status=codes[code], checked_at=START + timedelta(seconds=(offset + i) * step)))
+        for i, code in enumerate("".join(statuses))
+    ]
+
+
+def make_engine(db=None, **kwargs):
+    db = db if db is not None else AsyncMongoMockClient()["test"]
+    kwargs.setdefault("flap_window", 300)
+    return db, IncidentEngine(DatabaseService(db), confirm_failures=3, window=5, recover_successes=2, **kwargs)
+
+
+async def stored(db):
+    return await db.incidents.find({}, {"_id": 0}).to_list(None)
+
+
+def test_incident_opens_after_n_of_m_failures():
+    async def scenario():
+        db, engine = make_engine()
+        # Два сбоя из пяти - еще не инцидент
+        assert await engine.process(checks("oxoxo")) == []
+        # Третий сбой в окне из пяти подтверждает инцидент
+        opened = await engine.process(checks("x", offset=5))
+        return opened, await stored(db)
+
+    opened, documents = asyncio.run(scenario())
+    assert len(opened) == len(documents) == 1
+    incident = documents[0]
+    assert incident["failed_checks"] == 3
+    assert incident["started_at"] == START + timedelta(seconds=1 * 60)
+    assert incident["resolved_at"] is None
+
+
+def test_unknown_results_are_ignored():
+    async def scenario():
+        db, engine = make_engine()
+        await engine.process(checks("xx??x"))
+        return await stored(db)
+
+    documents = asyncio.run(scenario())
+    assert len(documents) == 1 and documents[0]["failed_checks"] == 3
+
+
+def test_incident_resolves_after_consecutive_successes():
+    async def scenario():
+        db, engine = make_engine()
+        await engine.process(checks("xxx"))
+        await engine.process(checks("oxo", offset=3))
+        assert (await stored(db))[0]["resolved_at"] is None
+        await engine.process(checks("o", offset=6))
+        return await stored(db)
+
+    incident = asyncio.run(scenario())[0]
+    assert incident["resolved_at"] == START + timedelta(seconds=5 * 60)
+    assert incident["failed_checks"] == 4
+    assert incident["status"] == SiteStatus.OFFLINE
+
+
+def test_failure_within_flap_window_reopens_same_incident():
+    async def scenario():
+        db, engine = make_engine()
+        await engine.process(checks("xxxoo"))
+        await engine.process(checks("xxx", offset=5))
+        return await stored(db)
+
+    documents = asyncio.run(scenario())
+    assert len(documents) == 1
+    assert documents[0]["resolved_at"] is None
+    assert documents[0]["flap_count"] == 1
+    assert documents[0]["failed_checks"] == 6
+
+
+def test_failure_after_flap_window_opens_new_incident():
+    async def scenario():
+        db, engine = make_engine(flap_window=60)
+        await engine.process(checks("xxxoo"))
+        await engine.process(checks("xxx", offset=20))
+        return await stored(db)
+
+    documents = asyncio.run(scenario())
+    assert len(documents) == 2
+    assert sorted(document["flap_count"] for document in documents) == [0, 0]
+
+
+def test_stale_engine_does_not_reopen_incident_resolved_elsewhere():
+    async def scenario():
+        db, worker = make_engine()
+        _, api = make_engine(db)
+        await worker.process(checks("xxx"))
+        # API видит открытый инцидент, затем воркер его закрывает
+        await api.process(checks("x", offset=3))
+        await worker.process(checks("oo", offset=4))
+        assert await api.process(checks("x", offset=6)) == []
+        return await stored(db)
+
+    documents = asyncio.run(scenario())
+    assert len(documents) == 1
+    assert documents[0]["resolved_at"] == START + timedelta(seconds=4 * 60)
+    assert documents[0]["failed_checks"] == 4
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from models import Site
+from services.leases import LeaseManager, site_partition
+
+PARTITIONS = 8
+
+
+def make_manager(db, worker_id):
+    return LeaseManager(db, worker_id, partitions=PARTITIONS, lease_ttl=30, renew_interval=10)
+
+
+def test_site_partition_is_stable_and_in_range():
+    partitions = {site_partition(f"site-{i}", PARTITIONS) for i in range(200)}
+    assert partitions == set(range(PARTITIONS))
+    assert site_partition("site-1", PARTITIONS) == site_partition("site-1", PARTITIONS)
+
+
+def test_single_worker_claims_every_partition():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        worker = make_manager(db, "a")
+        await worker.ensure_indexes()
+        owned = await worker.renew()
+        site = Site(name="s", url="http://s.test", owner_id="owner")
+        return owned, worker.owns(site)
+
+    owned, owns_site = asyncio.run(scenario())
+    assert owned == set(range(PARTITIONS))
+    assert owns_site
+
+
+def test_new_worker_gets_an_equal_share():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        a, b = make_manager(db, "a"), make_manager(db, "b")
+        await a.ensure_indexes()
+        await a.renew()
+        # b появляется, когда все партиции заняты; a отдает лишние на следующем цикле
+        assert await b.renew() == set()
+        await a.renew()
+        await b.renew()
+        return a.owned, b.owned
+
+    owned_a, owned_b = asyncio.run(scenario())
+    assert len(owned_a) == len(owned_b) == PARTITIONS // 2
+    assert owned_a.isdisjoint(owned_b)
+    assert owned_a | owned_b == set(range(PARTITIONS))
+
+
+def test_stopped_worker_releases_partitions():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        a, b = make_manager(db, "a"), make_manager(db, "b")
+        await a.ensure_indexes()
+        for worker in (a, b, a, b):
+            await worker.renew()
+        await a.stop()
+        await b.renew()
+        return a.owned, b.owned
+
+    owned_a, owned_b = asyncio.run(scenario())
+    assert owned_a == set()
+    assert owned_b == set(range(PARTITIONS))
+
+
+def test_expired_leases_of_dead_worker_are_taken_over():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        a, b = make_manager(db, "a"), make_manager(db, "b")
+        await a.ensure_indexes()
+        await a.renew()
+        # Воркер a пропал: heartbeat и аренда в прошлом
+        past = datetime.utcnow() - timedelta(minutes=5)
+        await db.probe_workers.update_one({"_id": "a"}, {"$set": {"heartbeat_at": past}})
+        await db.probe_leases.update_many({"owner": "a"}, {"$set": {"expires_at": past}})
+        return await b.renew()
+
+    assert asyncio.run(scenario()) == set(range(PARTITIONS))
+
+
+def test_owns_nothing_after_lease_validity_passes():
+    listener_calls = []
+
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        worker = make_manager(db, "a")
+        worker.listeners.append(listener_calls.append)
+        await worker.ensure_indexes()
+        await worker.renew()
+        site = Site(name="s", url="http://s.test", owner_id="owner")
+        worker._valid_until = asyncio.get_running_loop().time()
+        return worker.owns(site)
+
+    assert not asyncio.run(scenario())
+    assert listener_calls == [set(range(PARTITIONS))]
+
+
+def test_leftover_partitions_after_shrinking_are_not_claimed():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        old = LeaseManager(db, "old", partitions=PARTITIONS * 2, lease_ttl=30, renew_interval=10)
+        await old.ensure_indexes()
+        await old.renew()
+        await old.stop()
+        a, b = make_manager(db, "a"), make_manager(db, "b")
+        await a.ensure_indexes()
+        # Лишние документы уже есть в коллекции - воркеры их не берут
+        await db.probe_leases.insert_one({"_id": PARTITIONS * 3, "owner": None, "expires_at": datetime(1970, 1, 1)})
+        for worker in (a, b, a, b):
+            await worker.renew()
+        return a.owned, b.owned, await db.probe_leases.count_documents({})
+
+    owned_a, owned_b, documents = asyncio.run(scenario())
+    assert owned_a | owned_b == set(range(PARTITIONS))
+    assert len(owned_a) == len(owned_b) == PARTITIONS // 2
+    assert documents == PARTITIONS + 1
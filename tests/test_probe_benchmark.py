@@ -0,0 +1,34 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def test_probe_throughput_smoke_run():
+    """Короткий прогон бенчмарка на локальной ферме: без сети, с зависшими и TLS-сайтами"""
+    completed = subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.probe_throughput",
+            "--sites", "20", "--rounds", "1",
+            "--hang-fraction", "0.1", "--tls-fraction", "0.2",
+            "--timeout", "0.5", "--scheduler-seconds", "1",
+            "--max-fds", "500", "--json",
+        ],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    report = json.loads(completed.stdout)
+    assert report["failures"] == []
+    assert report["kinds"] == {"http": 15, "tls": 3, "hang": 2}
+    batch = report["batch"]
+    assert batch["checks"] == sum(batch["statuses"].values()) == 20
+    # Зависшие сайты завершаются по таймауту как offline, а не зависают в прогоне
+    assert batch["statuses"].get("offline", 0) >= 2
+    assert batch["seconds"] < 10
+    assert report["scheduler"]["checks"] > 0
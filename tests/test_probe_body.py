@@ -0,0 +1,133 @@
+import asyncio
+
+from aiohttp import web
+
+from models import ProbeMode, Site, SiteStatus
+from services.monitoring import MonitoringService
+
+CHUNK = 1024
+BIG_BODY = b"a" * (256 * 1024)
+# Ключевое слово начинается за 3 байта до границы фрагмента чтения
+STRADDLE_BODY = b"x" * (CHUNK - 3) + b"NEEDLE" + b"y" * 4000
+
+
+class Farm:
+    """Локальный сервер: запоминает методы запросов и клиентские соединения"""
+
+    def __init__(self):
+        self.methods = []
+        self.peers = []
+        self.url = None
+        self._runner = None
+
+    async def _handle(self, request):
+        self.methods.append(request.method)
+        self.peers.append(request.transport.get_extra_info("peername"))
+        body = {"/big": BIG_BODY, "/straddle": STRADDLE_BODY}.get(request.path, b"ok")
+        response = web.StreamResponse()
+        response.content_length = len(body)
+        await response.prepare(request)
+        if request.method != "HEAD":
+            for offset in range(0, len(body), 16 * 1024):
+                await response.write(body[offset:offset + 16 * 1024])
+        await response.write_eof()
+        return response
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+
+def probe(paths_and_settings, **service_kwargs):
+    """Последовательные проверки [(путь, поля Site)] на одном MonitoringService"""
+    async def scenario():
+        async with Farm() as farm:
+            service = MonitoringService(chunk_size=CHUNK, **service_kwargs)
+            await service.start()
+            try:
+                results = []
+                for path, fields in paths_and_settings:
+                    site = Site(name="site", url=farm.url + path, owner_id="owner", **fields)
+                    results.append(await service.check_site(site))
+                return farm, results
+            finally:
+                await service.close()
+
+    return asyncio.run(scenario())
+
+
+def test_get_capped_reads_exactly_the_cap():
+    _, [result] = probe([("/big", {"probe_mode": ProbeMode.GET_CAPPED, "max_body_bytes": 1000})])
+
+    assert result.status == SiteStatus.ONLINE
+    assert result.body_bytes == 1000
+
+
+def test_get_drains_only_up_to_drain_limit():
+    _, [result] = probe([("/big", {"probe_mode": ProbeMode.GET})], get_drain_bytes=4096)
+
+    assert result.body_bytes == 4096
+
+
+def test_literal_keyword_across_chunk_boundary_is_found():
+    _, [result] = probe([("/straddle", {"probe_mode": ProbeMode.KEYWORD, "keyword": "NEEDLE"})])
+
+    assert result.status == SiteStatus.ONLINE
+    assert result.keyword_found is True
+    assert result.body_bytes == 2 * CHUNK
+
+
+def test_regex_keyword_across_chunk_boundary_is_found():
+    _, [result] = probe([
+        ("/straddle", {"probe_mode": ProbeMode.KEYWORD, "keyword": r"NEE\w+E", "keyword_is_regex": True})
+    ])
+
+    assert result.keyword_found is True
+
+
+def test_keyword_beyond_cap_is_not_reported():
+    _, [result] = probe([
+        ("/straddle", {"probe_mode": ProbeMode.KEYWORD, "keyword": "NEEDLE", "max_body_bytes": CHUNK})
+    ])
+
+    assert result.keyword_found is False
+    assert result.body_bytes == CHUNK
+
+
+def test_missing_keyword_is_warning():
+    _, [result] = probe([("/big", {"probe_mode": ProbeMode.KEYWORD, "keyword": "absent"})])
+
+    assert result.status == SiteStatus.WARNING
+    assert result.keyword_found is False
+    assert result.body_bytes == len(BIG_BODY)
+    assert "Keyword not found" in result.error_message
+
+
+def test_head_reads_no_body():
+    farm, [result] = probe([("/big", {"probe_mode": ProbeMode.HEAD})])
+
+    assert farm.methods == ["HEAD"]
+    assert result.status == SiteStatus.ONLINE
+    assert result.body_bytes == 0
+
+
+def test_connection_reused_after_full_read_and_closed_after_early_stop():
+    small = ("/small", {"probe_mode": ProbeMode.GET})
+    capped = ("/big", {"probe_mode": ProbeMode.GET_CAPPED, "max_body_bytes": 100})
+
+    farm, results = probe([small, small, capped, small])
+
+    assert all(result.status == SiteStatus.ONLINE for result in results)
+    # Дочитанное тело возвращает соединение в пул, недочитанное - закрывает его
+    assert farm.peers[0] == farm.peers[1] == farm.peers[2]
+    assert farm.peers[3] != farm.peers[2]
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from services.quantiles import ZERO_KEY, LatencySketch, merge_sketches
+
+QS = (0.0, 0.5, 0.9, 0.95, 0.99, 1.0)
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def latencies(count, seed=7):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(4, 1.2) for _ in range(count)]
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(relative_accuracy):
+    values = latencies(5000)
+    sketch = LatencySketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+
+    estimates = sketch.quantiles(QS)
+
+    for q in QS:
+        exact = exact_quantile(values, q)
+        assert abs(estimates[q] - exact) <= relative_accuracy * exact + 1e-9
+
+
+def test_merged_sketches_match_single_sketch():
+    values = latencies(3000)
+    whole = LatencySketch()
+    parts = [LatencySketch() for _ in range(3)]
+    for i, value in enumerate(values):
+        whole.add(value)
+        parts[i % 3].add(value)
+
+    merged = merge_sketches([part.bins for part in parts] + [None, {}])
+
+    assert merged.bins == whole.bins
+    assert merged.count == len(values)
+    assert merged.quantiles(QS) == whole.quantiles(QS)
+
+
+def test_tiny_values_go_to_zero_bucket():
+    sketch = LatencySketch()
+    sketch.add(0.0, count=3)
+    sketch.add(100.0)
+
+    assert sketch.bins[ZERO_KEY] == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(100.0, rel=0.01)
+
+
+def test_empty_sketch_has_no_quantiles():
+    assert LatencySketch().quantiles([0.5, 0.99]) == {0.5: None, 0.99: None}
+
+
+def test_single_value():
+    sketch = LatencySketch()
+    sketch.add(250.0)
+
+    assert all(value == pytest.approx(250.0, rel=0.01) for value in sketch.quantiles(QS).values())
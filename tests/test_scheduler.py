@@ -0,0 +1,243 @@
+import asyncio
+from types import SimpleNamespace
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from database import DatabaseService
+from models import CheckResult, Site, SiteStatus
+from services.scheduler import CheckScheduler
+
+
+class FakeDatabase:
+    def __init__(self, sites, fail_refresh=False):
+        self.sites = sites
+        self.fail_refresh = fail_refresh
+        self.refreshes = 0
+        self.saved = []
+
+    async def get_all_sites(self):
+        self.refreshes += 1
+        if self.fail_refresh:
+            raise RuntimeError("database is down")
+        return list(self.sites)
+
+    async def record_check_results(self, results, progress=None):
+        self.saved.extend(results)
+
+
+class FakeMonitoring:
+    def __init__(self):
+        self.started = []
+        self.executor = SimpleNamespace(run=self.run)
+
+    async def run(self, site):
+        self.started.append((asyncio.get_running_loop().time(), site.id))
+        return CheckResult(site_id=site.id, status=SiteStatus.ONLINE, response_time=10.0)
+
+
+def make_sites(count, **fields):
+    return [Site(name=f"site-{i}", url=f"http://site-{i}.test", owner_id="owner", **fields) for i in range(count)]
+
+
+def make_scheduler(db, monitoring, **kwargs):
+    kwargs.setdefault("jitter", 0.0)
+    return CheckScheduler(db, monitoring, **kwargs)
+
+
+async def run_for(scheduler, seconds):
+    await scheduler.start()
+    await asyncio.sleep(seconds)
+    await scheduler.stop()
+
+
+def test_checks_are_paced_to_rate():
+    db, monitoring = FakeDatabase(make_sites(10)), FakeMonitoring()
+    scheduler = make_scheduler(db, monitoring, rate=20)
+
+    asyncio.run(run_for(scheduler, 0.3))
+
+    starts = [started for started, _ in monitoring.started]
+    assert 4 <= len(starts) <= 8
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert min(gaps) >= 1 / 20 - 0.01
+
+
+def test_results_are_flushed_on_stop():
+    db, monitoring = FakeDatabase(make_sites(5)), FakeMonitoring()
+    scheduler = make_scheduler(db, monitoring, rate=1000, flush_interval=60)
+
+    asyncio.run(run_for(scheduler, 0.1))
+
+    assert sorted(result.site_id for result in db.saved) == sorted(site.id for site in db.sites)
+
+
+def test_checked_site_is_rescheduled_after_its_interval():
+    sites = make_sites(1, check_interval=120)
+    db, monitoring = FakeDatabase(sites), FakeMonitoring()
+    scheduler = make_scheduler(db, monitoring, rate=1000)
+
+    async def scenario():
+        await scheduler.start()
+        await asyncio.sleep(0.05)
+        due = scheduler._due[sites[0].id] - asyncio.get_running_loop().time()
+        await scheduler.stop()
+        return due
+
+    due = asyncio.run(scenario())
+    assert len(monitoring.started) == 1
+    assert 119 <= due <= 120
+
+
+def test_interval_change_reschedules_site():
+    site = make_sites(1, check_interval=600)[0]
+    db, monitoring = FakeDatabase([site]), FakeMonitoring()
+    scheduler = make_scheduler(db, monitoring)
+
+    async def scenario():
+        await scheduler.refresh_sites()
+        first_due = scheduler._due[site.id]
+        db.sites = [site.copy(update={"check_interval": 30})]
+        await scheduler.refresh_sites()
+        return first_due, scheduler._due[site.id] - asyncio.get_running_loop().time()
+
+    first_due, due = asyncio.run(scenario())
+    assert due <= 30 < first_due
+
+
+def test_removed_site_is_forgotten():
+    sites = make_sites(2)
+    db, monitoring = FakeDatabase(sites), FakeMonitoring()
+    scheduler = make_scheduler(db, monitoring)
+
+    async def scenario():
+        await scheduler.refresh_sites()
+        db.sites = sites[:1]
+        await scheduler.refresh_sites()
+
+    asyncio.run(scenario())
+    assert set(scheduler._sites) == {sites[0].id}
+    assert set(scheduler._due) == {sites[0].id}
+
+
+def test_failed_refresh_keeps_dispatching_known_sites():
+    sites = make_sites(3)
+    db, monitoring = FakeDatabase(sites), FakeMonitoring()
+    scheduler = make_scheduler(db, monitoring, rate=1000, refresh_interval=0.05)
+
+    async def scenario():
+        await scheduler.refresh_sites()
+        db.fail_refresh = True
+        await run_for(scheduler, 0.3)
+
+    asyncio.run(scenario())
+    # Неудачная загрузка повторяется не на каждой итерации цикла
+    assert db.refreshes <= 3
+    assert {site_id for _, site_id in monitoring.started} == {site.id for site in sites}
+
+
+def test_failed_flush_keeps_batch_queued():
+    site = make_sites(1)[0]
+    db = FakeDatabase([site])
+    scheduler = make_scheduler(db, FakeMonitoring(), batch_size=2)
+    delivered = []
+
+    async def listener(batch):
+        delivered.extend(result for _, result in batch)
+
+    async def failing_write(results, progress=None):
+        raise RuntimeError("write failed")
+
+    async def scenario():
+        scheduler.listeners.append(listener)
+        scheduler._pending = [(site, CheckResult(site_id=site.id, status=SiteStatus.ONLINE)) for _ in range(3)]
+        original_write, db.record_check_results = db.record_check_results, failing_write
+        try:
+            await scheduler.flush()
+        except RuntimeError:
+            pass
+        assert len(scheduler._pending) == 3 and not delivered
+        db.record_check_results = original_write
+        await scheduler.flush()
+
+    asyncio.run(scenario())
+    assert not scheduler._pending
+    assert len(db.saved) == len(delivered) == 3
+
+
+def make_stored_scheduler():
+    """Планировщик с настоящим DatabaseService поверх mongomock"""
+    db = AsyncMongoMockClient()["test"]
+    service = DatabaseService(db)
+    site = make_sites(1)[0]
+    scheduler = make_scheduler(service, FakeMonitoring(), batch_size=10)
+    results = [CheckResult(site_id=site.id, status=SiteStatus.ONLINE, response_time=10.0) for _ in range(3)]
+    scheduler._pending = [(site, result) for result in results]
+    return db, service, scheduler
+
+
+async def flush_until_saved(scheduler, attempts=3):
+    for _ in range(attempts):
+        try:
+            await scheduler.flush()
+            return
+        except Exception:
+            continue
+
+
+async def stored_counts(db):
+    daily = await db.checks_daily.find({}, {"_id": 0, "total": 1, "online": 1}).to_list(None)
+    return await db.checks.count_documents({}), daily
+
+
+def test_retry_after_failed_status_update_does_not_duplicate_checks():
+    db, service, scheduler = make_stored_scheduler()
+    original = service.update_sites_status
+    calls = []
+
+    async def flaky_update(results):
+        calls.append(len(results))
+        if len(calls) == 1:
+            raise RuntimeError("sites write failed")
+        return await original(results)
+
+    service.update_sites_status = flaky_update
+
+    async def scenario():
+        await db.checks.create_index("id", unique=True)
+        await flush_until_saved(scheduler)
+        return await stored_counts(db)
+
+    checks, daily = asyncio.run(scenario())
+    assert len(calls) == 2 and not scheduler._pending
+    assert checks == 3
+    assert daily == [{"total": 3, "online": 3}]
+
+
+def test_retry_after_partial_insert_writes_the_rest_once():
+    db, service, scheduler = make_stored_scheduler()
+    collection = service.checks_collection
+    original_insert = collection.insert_many
+    attempts = []
+
+    async def partial_insert(documents, ordered=True):
+        attempts.append(len(documents))
+        if len(attempts) > 1:
+            return await original_insert(documents, ordered=ordered)
+        # Первая попытка: записан только первый документ, остальные упали
+        await original_insert(documents[:1], ordered=ordered)
+        raise BulkWriteError({"writeErrors": [
+            {"index": index, "code": 121, "errmsg": "validation failed"} for index in range(1, len(documents))
+        ]})
+
+    collection.insert_many = partial_insert
+
+    async def scenario():
+        await db.checks.create_index("id", unique=True)
+        await flush_until_saved(scheduler)
+        return await stored_counts(db)
+
+    checks, daily = asyncio.run(scenario())
+    assert attempts == [3, 2] and not scheduler._pending
+    assert checks == 3
+    assert daily == [{"total": 3, "online": 3}]